@@ -0,0 +1,59 @@
+"""脚本共用的 JSON 编解码层
+
+安装了 orjson 时使用 orjson 加速，否则回退到标准库 json。输出始终不转义非 ASCII 字符，
+indent=None 时输出不带空白的紧凑格式。
+"""
+
+import json
+from typing import Any, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: int | None = None) -> str:
+    """编码为字符串，indent 为 None 时输出紧凑格式
+
+    orjson 只支持 2 空格缩进，其他缩进宽度会回退到标准库。
+    """
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_INDENT_2 if indent == 2 else 0
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    if indent is None:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(obj, ensure_ascii=False, indent=indent)
+
+
+def iterencode(obj: Any, indent: int | None = None) -> Iterator[str]:
+    """逐段编码，顶层为列表或迭代器时每次只编码一个元素，用于流式写入大文件
+
+    拼接后的结果与 dumps(list(obj), indent) 一致。迭代器只会被消费一次，
+    可以直接传入数据库游标之类的生成器，整个数组不需要同时驻留内存。
+    """
+    if not isinstance(obj, (list, Iterator)):
+        yield dumps(obj, indent)
+        return
+
+    pad = "" if indent is None else " " * indent
+    first = True
+    for item in obj:
+        if indent is None:
+            yield ("[" if first else ",") + dumps(item)
+        else:
+            encoded = dumps(item, indent).replace("\n", "\n" + pad)
+            yield ("[" if first else ",") + "\n" + pad + encoded
+        first = False
+    if first:
+        yield "[]"
+    else:
+        yield "]" if indent is None else "\n]"
@@ -0,0 +1,327 @@
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+
+import httpx
+
+from playlist_http import map_unordered
+from playlist_probe import ProbeResult
+from playlist_sqlite import SqliteStore
+
+AUDIO_META_CACHE_PATH = "./.cache/audio_meta.sqlite3"
+# 首次读取的字节数，足够覆盖常见的 ID3v2 标签和第一帧
+HEAD_BYTES = 16 * 1024
+# ID3v1 标签固定在文件末尾的 128 字节
+ID3V1_SIZE = 128
+META_WORKERS = 8
+META_TIMEOUT = 15.0
+# 超过这个时间没有再被用到的条目会被清理，带签名的音频地址每次刷新都会产生新条目
+MAX_STALE = 30 * 24 * 3600
+
+# MPEG 音频帧头中的比特率表（kbps），按 (版本, 层) 索引
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+
+@dataclass
+class AudioMeta:
+    """从音频文件头解析出的元数据
+
+    duration 单位为秒，bitrate 单位为 kbps（VBR 文件为平均值），size 为文件字节数。
+    """
+
+    duration: float | None = None
+    bitrate: int | None = None
+    size: int | None = None
+
+
+@dataclass
+class _Frame:
+    version: float
+    layer: int
+    bitrate: int
+    sample_rate: int
+    samples: int
+    length: int
+    mono: bool
+
+
+def _id3v2_size(data: bytes) -> int:
+    """文件开头 ID3v2 标签的总长度，没有标签时为 0"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _parse_frame(data: bytes, pos: int) -> _Frame | None:
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = {0: 2.5, 2: 2, 3: 1}.get((b1 >> 3) & 3)
+    layer = {1: 3, 2: 2, 3: 1}.get((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    return _Frame(version, layer, bitrate, sample_rate, samples, length, (b3 >> 6) == 3)
+
+
+def _find_frame(data: bytes, start: int) -> tuple[int, _Frame] | None:
+    """从 start 开始找第一个有效的帧头，下一帧也在缓冲区内时一并校验，避免误判"""
+    for pos in range(start, len(data) - 3):
+        frame = _parse_frame(data, pos)
+        if frame is None:
+            continue
+        following = pos + frame.length
+        if following + 4 <= len(data) and _parse_frame(data, following) is None:
+            continue
+        return pos, frame
+    return None
+
+
+def _read_vbr_header(data: bytes, pos: int, frame: _Frame) -> tuple[int | None, int | None]:
+    """读取 Xing/Info 或 VBRI 头，返回 (帧数, 音频字节数)"""
+    if frame.version == 1:
+        side_info = 17 if frame.mono else 32
+    else:
+        side_info = 9 if frame.mono else 17
+    xing = pos + 4 + side_info
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4 : xing + 8], "big")
+        offset = xing + 8
+        frames = audio_bytes = None
+        if flags & 1:
+            frames = int.from_bytes(data[offset : offset + 4], "big")
+            offset += 4
+        if flags & 2:
+            audio_bytes = int.from_bytes(data[offset : offset + 4], "big")
+        return frames, audio_bytes
+    vbri = pos + 4 + 32
+    if data[vbri : vbri + 4] == b"VBRI":
+        audio_bytes = int.from_bytes(data[vbri + 10 : vbri + 14], "big")
+        frames = int.from_bytes(data[vbri + 14 : vbri + 18], "big")
+        return frames, audio_bytes
+    return None, None
+
+
+def parse_mp3_header(
+    data: bytes, offset: int, size: int | None, has_id3v1: bool = False
+) -> AudioMeta | None:
+    """从文件头部的字节中解析时长和比特率
+
+    有 Xing/Info 或 VBRI 头时按总帧数计算时长，否则按 CBR 用文件大小和比特率估算。
+
+    Args:
+        data: 文件中从 offset 开始的一段字节，需要包含第一个音频帧
+        offset: data 在文件中的起始位置，为 0 时会跳过开头的 ID3v2 标签
+        size: 文件总字节数，未知时 CBR 文件无法计算时长
+        has_id3v1: 文件末尾是否有 ID3v1 标签
+
+    Returns:
+        解析结果，不是 MPEG 音频时返回 None
+    """
+    found = _find_frame(data, _id3v2_size(data) if offset == 0 else 0)
+    if found is None:
+        return None
+    pos, frame = found
+    frames, audio_bytes = _read_vbr_header(data, pos, frame)
+    if audio_bytes is None and size is not None:
+        audio_bytes = size - (offset + pos) - (ID3V1_SIZE if has_id3v1 else 0)
+
+    if frames:
+        duration = frames * frame.samples / frame.sample_rate
+        bitrate = round(audio_bytes * 8 / duration / 1000) if audio_bytes else frame.bitrate
+    elif audio_bytes is not None:
+        duration = audio_bytes * 8 / (frame.bitrate * 1000)
+        bitrate = frame.bitrate
+    else:
+        return AudioMeta(bitrate=frame.bitrate, size=size)
+    return AudioMeta(duration=round(duration, 3), bitrate=bitrate, size=size)
+
+
+def _is_cbr(data: bytes, offset: int) -> bool:
+    found = _find_frame(data, _id3v2_size(data) if offset == 0 else 0)
+    return found is not None and _read_vbr_header(data, *found) == (None, None)
+
+
+async def _read_range(
+    client: httpx.AsyncClient, url: str, range_header: str, limit: int
+) -> tuple[bytes, int | None, bool]:
+    """读取文件的一段字节，服务器忽略 Range 时最多读取 limit 字节后断开
+
+    Returns:
+        读取到的字节、文件总大小（未知时为 None），以及服务器是否按 Range 返回了 206。
+        返回 200 时读取到的字节从文件开头算起
+    """
+    async with client.stream(
+        "GET",
+        url,
+        headers={"Range": range_header},
+        follow_redirects=True,
+        timeout=META_TIMEOUT,
+    ) as response:
+        if response.status_code not in (200, 206):
+            raise httpx.HTTPStatusError(
+                f"HTTP {response.status_code}", request=response.request, response=response
+            )
+        size = None
+        content_range = response.headers.get("content-range", "")
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            size = int(content_range.rsplit("/", 1)[1])
+        elif response.status_code == 200 and response.headers.get("content-length", "").isdigit():
+            size = int(response.headers["content-length"])
+        chunks: list[bytes] = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= limit:
+                break
+    return b"".join(chunks)[:limit], size, response.status_code == 206
+
+
+async def read_audio_meta(client: httpx.AsyncClient, url: str) -> AudioMeta | None:
+    """只用 Range 请求读取文件头部（必要时再读尾部），解析 MP3 的时长、比特率和大小
+
+    - ID3v2 标签比首次读取的范围大（例如内嵌封面）时，再从标签结束处读取一段，
+      服务器忽略 Range 返回 200 时从文件开头读到标签之后
+    - 没有 Xing/VBRI 头的 CBR 文件需要读取末尾 128 字节判断是否有 ID3v1 标签，
+      服务器不支持 Range 时按没有 ID3v1 标签处理
+
+    Args:
+        client: 共享的连接池客户端
+        url: 音频地址
+    """
+    data, size, _ = await _read_range(client, url, f"bytes=0-{HEAD_BYTES - 1}", HEAD_BYTES)
+    offset = 0
+    tag_size = _id3v2_size(data)
+    if tag_size + 4 > len(data) and (size is None or tag_size < size):
+        data, size, partial = await _read_range(
+            client,
+            url,
+            f"bytes={tag_size}-{tag_size + HEAD_BYTES - 1}",
+            tag_size + HEAD_BYTES,
+        )
+        if not partial:
+            data = data[tag_size:]
+        offset = tag_size
+
+    # CBR 文件按大小估算时长，末尾的 ID3v1 标签不属于音频数据
+    has_id3v1 = False
+    if size is not None and size > HEAD_BYTES and _is_cbr(data, offset):
+        tail, _, partial = await _read_range(client, url, f"bytes=-{ID3V1_SIZE}", ID3V1_SIZE)
+        has_id3v1 = partial and tail[:3] == b"TAG"
+    return parse_mp3_header(data, offset, size, has_id3v1)
+
+
+class AudioMetaCache(SqliteStore):
+    """基于 SQLite 的音频元数据缓存，以 (URL, 文件验证器) 为键
+
+    验证器来自探测阶段的 ETag（没有时用 Last-Modified 和文件大小），
+    文件没有变化时不会再发出任何请求。无法解析的文件也会被记录，避免重复读取。
+    checked_at 记录条目最近一次写入或命中的时间，关闭时清理超过 MAX_STALE 未用到的条目。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS audio_meta (
+            url TEXT PRIMARY KEY,
+            validator TEXT NOT NULL,
+            duration REAL,
+            bitrate INTEGER,
+            size INTEGER,
+            checked_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = AUDIO_META_CACHE_PATH):
+        super().__init__(path)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str, validator: str) -> AudioMeta | None:
+        row = self.conn.execute(
+            "SELECT duration, bitrate, size FROM audio_meta WHERE url = ? AND validator = ?",
+            (url, validator),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE audio_meta SET checked_at = ? WHERE url = ?", (time.time(), url)
+        )
+        return AudioMeta(*row)
+
+    def set(self, url: str, validator: str, meta: AudioMeta) -> None:
+        self.write(
+            "INSERT OR REPLACE INTO audio_meta (url, validator, duration, bitrate, size, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, validator, meta.duration, meta.bitrate, meta.size, time.time()),
+        )
+
+    def prune(self) -> int:
+        """清理长时间没有用到的条目，返回删除数量"""
+        return self.write(
+            "DELETE FROM audio_meta WHERE checked_at < ?", (time.time() - MAX_STALE,)
+        )
+
+
+async def read_audio_metas(
+    client: httpx.AsyncClient,
+    probes: dict[str, ProbeResult],
+    cache: AudioMetaCache,
+    workers: int = META_WORKERS,
+) -> dict[str, AudioMeta]:
+    """并发读取一组可用音频源的元数据，验证器未变化的直接使用缓存
+
+    Args:
+        client: 共享的连接池客户端
+        probes: verify_sources() 的探测结果，只处理其中可用的地址
+        cache: 元数据缓存
+        workers: 最大并发数
+
+    Returns:
+        每个地址的元数据，读取失败的地址不在结果中
+    """
+    results: dict[str, AudioMeta] = {}
+    pending: list[str] = []
+    for url, probe in probes.items():
+        if not probe.alive:
+            continue
+        cached = cache.get(url, probe.validator)
+        if cached is None:
+            pending.append(url)
+        else:
+            results[url] = cached
+
+    async with aclosing(
+        map_unordered(pending, lambda url: read_audio_meta(client, url), workers)
+    ) as metas:
+        async for url, meta in metas:
+            if isinstance(meta, BaseException):
+                print(f"读取音频元数据失败: {url} - {meta}")
+                continue
+            meta = meta or AudioMeta(size=probes[url].size)
+            cache.set(url, probes[url].validator, meta)
+            results[url] = meta
+    return results
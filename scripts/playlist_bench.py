@@ -0,0 +1,474 @@
+"""歌单脚本的离线基准测试
+
+生成指定规模的合成歌单，用 httpx.MockTransport 模拟网易云/QQ音乐上游（可配置延迟、
+错误率和限流），在独立子进程中运行 playlist_dump.download() 或 playlist_handle.main()，
+报告每种模式的歌曲吞吐量、峰值内存和请求数，全程不访问网络。
+codec 模式不运行脚本，只测量 json_codec 与标准库对合成 musics.json 的读写耗时；
+tracks 模式比较逐个构造 pydantic 模型与批量 TypeAdapter 校验/导出的 CPU 时间和内存。
+解析函数的正确性检查见 playlist_checks.py。
+
+用法:
+    python scripts/playlist_bench.py --sizes 1000,10000 --latency 0.02 --error-rate 0.01
+    python scripts/playlist_bench.py --modes dump --sizes 100000 --output bench.json
+    python scripts/playlist_bench.py --modes codec --sizes 1000,10000,100000
+    python scripts/playlist_bench.py --modes tracks --sizes 10000,100000
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from urllib.parse import parse_qs
+
+import httpx
+
+MODES = ["dump", "handle", "codec", "tracks"]
+# 模拟的音频文件：MPEG-1 Layer III 128kbps 44.1kHz 的帧（417 字节）重复到 4MB
+AUDIO_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+AUDIO_SIZE = 4 * 1024 * 1024
+
+
+class MockUpstream:
+    """模拟的上游接口，按路径返回合成数据
+
+    Args:
+        latency: 每个请求的基础延迟（秒）
+        jitter: 在基础延迟上叠加的随机延迟上限（秒）
+        error_rate: 返回 503 的概率
+        rate_limit: 每个主机每秒允许的请求数，超出返回 429，0 表示不限流
+        seed: 随机种子
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.01,
+        error_rate: float = 0.0,
+        rate_limit: int = 0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.requests: Counter[str] = Counter()
+        self.windows: dict[str, tuple[int, int]] = {}
+
+    def _throttled(self, host: str) -> bool:
+        if not self.rate_limit:
+            return False
+        second = int(time.monotonic())
+        window, count = self.windows.get(host, (second, 0))
+        if window != second:
+            window, count = second, 0
+        self.windows[host] = (window, count + 1)
+        return count >= self.rate_limit
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.requests[host] += 1
+        await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        if self._throttled(host):
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        if self.random.random() < self.error_rate:
+            return httpx.Response(503)
+
+        params = {k: v[0] for k, v in parse_qs(request.url.query.decode()).items()}
+        path = request.url.path
+        if path.endswith(".mp3"):
+            return self.audio(request)
+        if path.endswith("/song/media"):
+            # 歌词接口带 ETag，用于验证条件请求
+            body = json.dumps(self.lyric(params.get("id", ""))).encode()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if request.headers.get("if-none-match") == etag:
+                return httpx.Response(304, headers={"ETag": etag})
+            return httpx.Response(
+                200,
+                content=body,
+                headers={"ETag": etag, "Content-Type": "application/json"},
+            )
+        if params.get("action") == "qq" and params.get("module") == "get_url":
+            mids = params.get("mids", "").split(",")
+            return httpx.Response(200, json={"data": [self.qq_song(m) for m in mids]})
+        if params.get("action") == "qq" and params.get("module") == "lyric":
+            lrc = self.lyric(params.get("mid", "")).get("lyric", "")
+            return httpx.Response(
+                200, json={"data": {"lyric": base64.b64encode(lrc.encode()).decode()}}
+            )
+        if path.endswith("/song/detail"):
+            ids = json.loads(params.get("ids", "[]"))
+            return httpx.Response(
+                200, json={"songs": [self.ncm_song(str(i)) for i in ids], "code": 200}
+            )
+        return httpx.Response(200, content=b"")
+
+    def audio(self, request: httpx.Request) -> httpx.Response:
+        """音频文件只响应 HEAD 和 Range 请求，内容是 128kbps CBR 帧的重复"""
+        headers = {"Content-Type": "audio/mpeg", "Accept-Ranges": "bytes", "ETag": '"v1"'}
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={**headers, "Content-Length": str(AUDIO_SIZE)})
+        start, _, end = request.headers.get("range", "bytes=0-0")[6:].partition("-")
+        if not start:
+            start, end = AUDIO_SIZE - int(end), AUDIO_SIZE - 1
+        start, end = int(start), min(int(end or AUDIO_SIZE - 1), AUDIO_SIZE - 1)
+        first = start // len(AUDIO_FRAME)
+        count = (end - first * len(AUDIO_FRAME)) // len(AUDIO_FRAME) + 1
+        content = (AUDIO_FRAME * count)[start - first * len(AUDIO_FRAME) :][: end - start + 1]
+        return httpx.Response(
+            206,
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{AUDIO_SIZE}"},
+            content=content,
+        )
+
+    def lyric(self, mid: str) -> dict:
+        if mid.endswith("7"):
+            return {"nolyric": True, "code": 200}
+        lines = "\n".join(f"[00:{i:02d}.00]line {i} of {mid}" for i in range(40))
+        return {"lyric": lines, "code": 200}
+
+    def qq_song(self, mid: str) -> dict:
+        return {
+            "mid": mid,
+            "song": f"Song {mid}",
+            "singer": f"Singer {mid[-2:]}",
+            "album": f"Album {mid[-3:]}",
+            "url": f"http://cdn.test/{mid}.mp3",
+            "cover": f"https://cdn.test/{mid}.jpg",
+            "link": f"https://y.qq.com/n/ryqq/songDetail/{mid}",
+        }
+
+    def ncm_song(self, song_id: str) -> dict:
+        return {
+            "id": int(song_id),
+            "name": f"Song {song_id}",
+            "ar": [{"id": 1, "name": f"Singer {song_id[-2:]}"}],
+            "al": {"id": 1, "name": f"Album {song_id[-3:]}", "picUrl": ""},
+            "alia": [],
+        }
+
+
+def generate_playlists(path: str, size: int, seed: int = 0) -> None:
+    """生成合成歌单：一半网易云、一半QQ音乐，约 10% 的歌曲在多个歌单中重复出现"""
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    ncm_ids = [str(100000 + i) for i in range(size // 2)]
+    qq_ids = [f"qq{i:08d}" for i in range(size - size // 2)]
+    duplicates = rng.sample(ncm_ids, len(ncm_ids) // 10)
+
+    def ncm_track(song_id: str) -> dict:
+        return {
+            "id": int(song_id),
+            "name": f"Song {song_id}",
+            "ar": [{"name": f"Singer {song_id[-2:]}"}],
+            "al": {"name": f"Album {song_id[-3:]}", "picUrl": ""},
+            "alia": [],
+        }
+
+    playlists = {
+        "ncm-main.json": {
+            "type": "ncm",
+            "playlist": {"tracks": [ncm_track(i) for i in ncm_ids]},
+        },
+        "ncm-extra.json": {
+            "type": "ncm",
+            "playlist": {"tracks": [ncm_track(i) for i in duplicates]},
+        },
+        "qq-main.json": {
+            "type": "qq",
+            "playlist": {"tracks": [{"id": mid} for mid in qq_ids]},
+        },
+    }
+    for filename, playlist in playlists.items():
+        with open(os.path.join(path, filename), "w", encoding="utf-8") as f:
+            json.dump(playlist, f, ensure_ascii=False)
+
+
+def generate_catalog(size: int, seed: int = 0) -> list[dict]:
+    """生成与 musics.json 结构一致的合成歌曲列表，每首歌带一段约 40 行的歌词"""
+    rng = random.Random(seed)
+    songs = []
+    for i in range(size):
+        lines = [f"第 {j} 行歌词 lyric line {rng.randint(0, 9999)}" for j in range(40)]
+        times = [j * 3500 + rng.randint(0, 999) for j in range(40)]
+        songs.append(
+            {
+                "id": str(100000 + i),
+                "title": f"歌曲 {i}",
+                "artist": f"歌手 {i % 997}",
+                "album": f"专辑 {i % 4999}",
+                "alias": [],
+                "cover": f"https://p1.music.126.net/{i}.jpg",
+                "src": f"https://m701.music.126.net/{i}.mp3",
+                "songLink": f"https://music.163.com/#/song?id={100000 + i}",
+                "lrc": "\n".join(
+                    f"[{t // 60000:02d}:{t // 1000 % 60:02d}.{t % 1000 // 10:02d}]{line}"
+                    for t, line in zip(times, lines)
+                ),
+                "timeline": {"times": times, "lines": lines, "pure": False},
+                "offset": 0,
+                "source": "ncm",
+            }
+        )
+    return songs
+
+
+async def run_codec(args: argparse.Namespace) -> dict:
+    """测量标准库 json 与 json_codec 读写合成歌曲列表的耗时"""
+    import json_codec
+    from playlist_io import write_json_atomic
+
+    songs = generate_catalog(args.size, args.seed)
+    workdir = tempfile.mkdtemp(prefix="playlist-bench-")
+    path = os.path.join(workdir, "musics.json")
+
+    def timed(fn) -> float:
+        started_at = time.perf_counter()
+        fn()
+        return round(time.perf_counter() - started_at, 4)
+
+    timings = {}
+    text = json.dumps(songs, ensure_ascii=False, indent=2)
+    timings["stdlib.dumps"] = timed(
+        lambda: json.dumps(songs, ensure_ascii=False, indent=2)
+    )
+    timings["stdlib.loads"] = timed(lambda: json.loads(text))
+    timings["codec.dumps"] = timed(lambda: json_codec.dumps(songs, indent=2))
+    timings["codec.dumps_compact"] = timed(lambda: json_codec.dumps(songs))
+    timings["codec.loads"] = timed(lambda: json_codec.loads(text.encode("utf-8")))
+    # 只计流式编码本身，写文件的耗时主要取决于 fsync
+    timings["codec.iterencode"] = timed(
+        lambda: sum(len(chunk) for chunk in json_codec.iterencode(songs, 2))
+    )
+
+    started_at = time.perf_counter()
+    await write_json_atomic(path, songs, indent=2)
+    timings["codec.write"] = round(time.perf_counter() - started_at, 4)
+    size_indented = os.path.getsize(path)
+    started_at = time.perf_counter()
+    await write_json_atomic(path, songs)
+    timings["codec.write_compact"] = round(time.perf_counter() - started_at, 4)
+    size_compact = os.path.getsize(path)
+    os.remove(path)
+    os.rmdir(workdir)
+
+    return {
+        "mode": args.mode,
+        "size": args.size,
+        "backend": json_codec.BACKEND,
+        "timings": timings,
+        "bytes": {"indent": size_indented, "compact": size_compact},
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def measure(fn) -> tuple[float, float, object]:
+    """返回 fn 的 CPU 时间（秒）、执行期间的内存峰值（MB）和返回值"""
+    tracemalloc.start()
+    started_at = time.process_time()
+    result = fn()
+    cpu = time.process_time() - started_at
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak / 1024 / 1024, result
+
+
+async def run_tracks(args: argparse.Namespace) -> dict:
+    """比较逐个构造模型和批量校验两种方式处理歌单歌曲的开销，结果折算为每 1 万首"""
+    from pydantic import BaseModel
+
+    import playlist_dump
+
+    class ModelSongInfo(BaseModel):
+        """旧版的 SongInfo，每首歌一个 pydantic 模型"""
+
+        id: str
+        offset: int = 0
+        lrcmid: str = ""
+        source_type: str = ""
+        alia: list[str] = []
+
+    rng = random.Random(args.seed)
+    tracks = [
+        {
+            "id": str(100000 + i),
+            "offset": rng.choice([0, 0, 0, 500]),
+            "lrcmid": "",
+            "source_type": "ncm",
+            "alia": [f"别名 {i}"] if i % 7 == 0 else [],
+        }
+        for i in range(args.size)
+    ]
+    songs = playlist_dump.SONG_LIST.validate_python(
+        [
+            {k: v for k, v in song.items() if k != "timeline"}
+            for song in generate_catalog(args.size, args.seed)
+        ]
+    )
+
+    scale = 10000 / args.size
+    results = {}
+    for name, fn in {
+        "validate.before": lambda: [ModelSongInfo(**track) for track in tracks],
+        "validate.after": lambda: playlist_dump.SONG_INFO_LIST.validate_python(tracks),
+        "dump.before": lambda: [song.model_dump(by_alias=True) for song in songs],
+        "dump.after": lambda: playlist_dump.SONG_LIST.dump_python(songs, by_alias=True),
+    }.items():
+        cpu, peak_mb, _ = measure(fn)
+        results[name] = {
+            "cpu_ms_per_10k": round(cpu * 1000 * scale, 2),
+            "peak_mb_per_10k": round(peak_mb * scale, 2),
+        }
+    return {"mode": args.mode, "size": args.size, "tracks": results}
+
+
+async def run_child(args: argparse.Namespace) -> dict:
+    """在当前进程中运行一次基准测试（由父进程以子进程方式调用）"""
+    if args.mode == "codec":
+        return await run_codec(args)
+    if args.mode == "tracks":
+        return await run_tracks(args)
+
+    import playlist_http
+    import playlist_dump  # noqa: F401  注册来源适配器及其主机限流配置
+    import playlist_sources
+
+    upstream = MockUpstream(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+    playlist_http.base_transport = httpx.MockTransport(upstream.handle)
+    for limit in [playlist_http.DEFAULT_HOST_LIMIT, *playlist_sources.host_limits().values()]:
+        limit.rate = limit.max_rate = args.client_rate
+        limit.burst = limit.max_in_flight = args.client_in_flight
+
+    workdir = tempfile.mkdtemp(prefix="playlist-bench-")
+    os.chdir(workdir)
+    generate_playlists("./data/playlists", args.size, args.seed)
+
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.mode == "dump":
+            import playlist_dump
+
+            await playlist_dump.download(force=True)
+            target_path = playlist_dump.TARGET_PATH
+        else:
+            import playlist_handle
+
+            with open(playlist_handle.TARGET_PATH, "w", encoding="utf-8") as f:
+                f.write("[]")
+            await playlist_handle.main()
+            target_path = playlist_handle.TARGET_PATH
+    elapsed = time.perf_counter() - started_at
+
+    with open(target_path, "r", encoding="utf-8") as f:
+        songs = len(json.load(f))
+    return {
+        "mode": args.mode,
+        "size": args.size,
+        "songs": songs,
+        "elapsed": round(elapsed, 3),
+        # 按输入的歌单条目数计算吞吐量，不同模式之间可以直接比较
+        "songs_per_sec": round(args.size / elapsed, 1) if elapsed else 0.0,
+        # Linux 上 ru_maxrss 单位为 KB
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "requests": sum(upstream.requests.values()),
+        "requests_by_host": dict(upstream.requests),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--client-rate", type=float, default=1000.0)
+    parser.add_argument("--client-in-flight", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="dump", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=1000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_child(args))))
+        return
+
+    results = []
+    shared = [
+        f"--latency={args.latency}",
+        f"--jitter={args.jitter}",
+        f"--error-rate={args.error_rate}",
+        f"--rate-limit={args.rate_limit}",
+        f"--client-rate={args.client_rate}",
+        f"--client-in-flight={args.client_in_flight}",
+        f"--seed={args.seed}",
+    ]
+    # 每个组合在独立子进程中运行，峰值内存互不影响
+    for mode in args.modes.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child"]
+                + [f"--mode={mode}", f"--size={size}"]
+                + shared,
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode != 0:
+                error = (process.stderr.strip().splitlines() or ["unknown error"])[-1]
+                results.append({"mode": mode, "size": size, "error": error})
+                print(f"{mode:<8}{size:>8} 首  运行失败: {error}")
+                continue
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            results.append(result)
+            if mode == "codec":
+                timings = "  ".join(
+                    f"{name} {seconds:.3f}s" for name, seconds in result["timings"].items()
+                )
+                print(f"{mode:<8}{size:>8} 首  [{result['backend']}]  {timings}")
+                continue
+            if mode == "tracks":
+                for name, cost in result["tracks"].items():
+                    print(
+                        f"{mode:<8}{size:>8} 首  {name:<16}{cost['cpu_ms_per_10k']:>10.2f} ms/万首"
+                        f"  {cost['peak_mb_per_10k']:>8.2f} MB/万首"
+                    )
+                continue
+            print(
+                f"{mode:<8}{size:>8} 首  {result['songs']:>8} 首输出  {result['elapsed']:>9.2f}s"
+                f"  {result['songs_per_sec']:>9.1f} 首/秒  {result['peak_rss_mb']:>8.1f} MB"
+                f"  {result['requests']:>8} 请求"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
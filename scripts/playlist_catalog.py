@@ -0,0 +1,86 @@
+import hashlib
+import os
+from typing import Iterable
+
+import aiofiles
+
+import json_codec
+from playlist_io import write_text_atomic
+
+SHARDED_PATH = "./data/musics"
+# 歌词分片数量，歌曲按 (来源, ID) 的哈希分到固定的分片中
+LYRIC_BUCKETS = 64
+# 放进歌词分片、不出现在索引中的字段
+LYRIC_FIELDS = ("lrc", "timeline")
+
+
+def song_key(song: dict) -> str:
+    """歌曲在分片格式中的键，不同来源的歌曲ID可能相同，因此带上来源"""
+    return f"{song.get('source', '')}:{song.get('id', '')}"
+
+
+def lyric_bucket(song: dict, buckets: int = LYRIC_BUCKETS) -> str:
+    """计算歌曲歌词所在的分片名"""
+    key = song_key(song).encode("utf-8")
+    return f"{int(hashlib.sha1(key).hexdigest(), 16) % buckets:02x}"
+
+
+async def _write_if_changed(path: str, content: str) -> bool:
+    if os.path.exists(path):
+        async with aiofiles.open(path, "r", encoding="utf-8") as f:
+            if await f.read() == content:
+                return False
+    await write_text_atomic(path, content)
+    return True
+
+
+async def write_sharded_catalog(
+    songs: Iterable[dict], path: str = SHARDED_PATH, buckets: int = LYRIC_BUCKETS
+) -> int:
+    """把歌曲列表写成按需加载的分片格式
+
+    目录结构:
+        index.json        紧凑的歌曲索引，只包含元数据，不包含歌词
+        lyrics/<xx>.json  按哈希分桶的歌词分片，内容为 {"来源:ID": {"lrc": 歌词, "timeline": 时间轴}}
+        manifest.json     "来源:ID" 到歌词分片的映射
+
+    播放器只需加载 index.json，在歌曲开始播放时再按 manifest 加载对应的歌词分片。
+    内容未变化的文件不会被重写，不再使用的分片会被删除。
+
+    Returns:
+        实际写入的文件数量
+    """
+    index: list[dict] = []
+    shard_of: dict[str, str] = {}
+    shards: dict[str, dict[str, dict]] = {}
+    for song in songs:
+        entry = {k: v for k, v in song.items() if k not in LYRIC_FIELDS}
+        index.append(entry)
+        if song.get("lrc"):
+            bucket = lyric_bucket(song, buckets)
+            key = song_key(song)
+            shards.setdefault(bucket, {})[key] = {
+                k: song[k] for k in LYRIC_FIELDS if song.get(k) is not None
+            }
+            shard_of[key] = f"lyrics/{bucket}.json"
+
+    files = {
+        "index.json": json_codec.dumps(index),
+        "manifest.json": json_codec.dumps(
+            {"index": "index.json", "buckets": buckets, "shards": shard_of}
+        ),
+    }
+    for bucket, lyrics in shards.items():
+        files[f"lyrics/{bucket}.json"] = json_codec.dumps(lyrics)
+
+    written = 0
+    for name, content in files.items():
+        if await _write_if_changed(os.path.join(path, name), content):
+            written += 1
+
+    lyrics_dir = os.path.join(path, "lyrics")
+    if os.path.isdir(lyrics_dir):
+        for name in os.listdir(lyrics_dir):
+            if f"lyrics/{name}" not in files:
+                os.remove(os.path.join(lyrics_dir, name))
+    return written
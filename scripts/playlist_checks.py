@@ -0,0 +1,135 @@
+"""歌单脚本中纯解析函数的示例检查
+
+用固定的输入检查 parse_lrc 和 parse_mp3_header 的边界行为（偏移量方向、
+重复时间戳、Xing 头与带 ID3v1 标签的 CBR 文件），不访问网络，失败时以非零状态退出。
+
+用法:
+    python scripts/playlist_checks.py
+"""
+
+import sys
+import traceback
+
+from playlist_audio_meta import ID3V1_SIZE, parse_mp3_header
+from playlist_lrc import parse_lrc
+
+# MPEG-1 Layer III 128kbps 44.1kHz 立体声，无填充，每帧 417 字节、1152 个采样
+CBR_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+FRAME_SECONDS = 1152 / 44100
+
+
+def id3v2_tag(size: int) -> bytes:
+    """内容为 size 个零字节的 ID3v2.4 标签"""
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + bytes(size)
+
+
+def xing_frame(frames: int, audio_bytes: int) -> bytes:
+    """带 Xing 头（帧数和字节数）的第一帧，MPEG-1 立体声的边信息为 32 字节"""
+    body = bytes(32) + b"Xing" + (3).to_bytes(4, "big")
+    body += frames.to_bytes(4, "big") + audio_bytes.to_bytes(4, "big")
+    return CBR_FRAME[:4] + body + bytes(413 - len(body))
+
+
+def check_lrc_offset_sign() -> None:
+    # 正的偏移量让歌词提前显示，即时间戳变小
+    assert parse_lrc("[00:10.00]a", offset=500).times == [9500]
+    assert parse_lrc("[00:10.00]a", offset=-500).times == [10500]
+    assert parse_lrc("[offset:+500]\n[00:10.00]a").times == [9500]
+    # [offset:] 标签和 offset 参数叠加
+    assert parse_lrc("[offset:300]\n[00:10.00]a", offset=200).times == [9500]
+    # 提前到 0 之前的行钳制在 0
+    assert parse_lrc("[00:00.20]a", offset=500).times == [0]
+
+
+def check_lrc_duplicate_timestamps() -> None:
+    # 相同时间戳的原文和翻译合并为一行
+    timeline = parse_lrc("[00:01.00]原文\n[00:01.00]翻译\n[00:02.00]下一行")
+    assert timeline.times == [1000, 2000]
+    assert timeline.lines == ["原文\n翻译", "下一行"]
+    # 完全相同的行只保留一次
+    assert parse_lrc("[00:01.00]a\n[00:01.00]a").lines == ["a"]
+    # 一行多个时间标签展开后按时间排序
+    timeline = parse_lrc("[00:03.00][00:01.00]副歌\n[00:02.00]主歌")
+    assert timeline.times == [1000, 2000, 3000]
+    assert timeline.lines == ["副歌", "主歌", "副歌"]
+
+
+def check_lrc_fractions_and_pure() -> None:
+    # 小数部分按毫秒位数补齐，.5 是 500 毫秒，.05 是 50 毫秒
+    assert parse_lrc("[00:01.5]a\n[00:02.05]b\n[00:03:250]c").times == [1500, 2050, 3250]
+    timeline = parse_lrc("[ti:标题]\n[00:00.00]pure_music_without_lyric")
+    assert timeline.pure and timeline.times == []
+
+
+def check_mp3_cbr_with_id3v1() -> None:
+    frames = 200
+    audio = CBR_FRAME * frames
+    size = len(audio) + ID3V1_SIZE
+    meta = parse_mp3_header(audio, 0, size, has_id3v1=True)
+    assert meta is not None
+    assert meta.bitrate == 128 and meta.size == size
+    # 末尾的 ID3v1 标签不计入音频数据
+    assert meta.duration == round(len(audio) * 8 / 128000, 3)
+    without_tag = parse_mp3_header(audio, 0, size)
+    assert without_tag.duration > meta.duration
+
+
+def check_mp3_cbr_after_id3v2() -> None:
+    tag = id3v2_tag(1000)
+    audio = CBR_FRAME * 50
+    data = tag + audio
+    # offset 为 0 时跳过开头的 ID3v2 标签，标签不计入音频数据
+    meta = parse_mp3_header(data, 0, len(data))
+    assert meta.duration == round(len(audio) * 8 / 128000, 3)
+    # 从标签结束处读取的数据，offset 为标签长度
+    meta = parse_mp3_header(audio, len(tag), len(data))
+    assert meta.duration == round(len(audio) * 8 / 128000, 3)
+
+
+def check_mp3_xing() -> None:
+    frames = 1000
+    audio_bytes = 96 * 1000 // 8 * round(frames * FRAME_SECONDS)
+    data = xing_frame(frames, audio_bytes) + CBR_FRAME * 4
+    # 有 Xing 头时按帧数计算时长，与文件大小和 ID3v1 标签无关
+    meta = parse_mp3_header(data, 0, 10 * 1024 * 1024, has_id3v1=True)
+    assert meta.duration == round(frames * FRAME_SECONDS, 3)
+    assert meta.bitrate == round(audio_bytes * 8 / (frames * FRAME_SECONDS) / 1000)
+    assert meta.bitrate != 128
+
+
+def check_mp3_not_audio() -> None:
+    assert parse_mp3_header(b"<html>not found</html>" * 20, 0, 440) is None
+    # 文件大小未知时 CBR 只能给出比特率
+    meta = parse_mp3_header(CBR_FRAME * 4, 0, None)
+    assert meta.bitrate == 128 and meta.duration is None
+
+
+CHECKS = [
+    check_lrc_offset_sign,
+    check_lrc_duplicate_timestamps,
+    check_lrc_fractions_and_pure,
+    check_mp3_cbr_with_id3v1,
+    check_mp3_cbr_after_id3v2,
+    check_mp3_xing,
+    check_mp3_not_audio,
+]
+
+
+def main() -> int:
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+        except Exception:
+            failed += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+        else:
+            print(f"ok   {check.__name__}")
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} 项检查通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
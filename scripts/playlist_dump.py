@@ -1,20 +1,71 @@
 import asyncio
 import base64
-from typing import Literal
-from urllib.parse import unquote
+from urllib.parse import quote, unquote
 import aiofiles
 import os
 import httpx
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
+import hashlib
 import json
 import time
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+
+import json_codec
+from playlist_audio_meta import AudioMeta, AudioMetaCache, read_audio_metas
+from playlist_catalog import SHARDED_PATH, write_sharded_catalog
+from playlist_http import (
+    HostLimit,
+    RateLimiter,
+    create_client,
+    hedge,
+)
+from playlist_http_cache import HttpCache
+from playlist_io import DumpJournal, write_json_atomic
+from playlist_lrc import LyricTimeline, parse_lrc
+from playlist_lyric_cache import PURE_MUSIC_LRC, LyricCache
+from playlist_manifest import PlaylistManifest
+from playlist_mirrors import MirrorHealth, ncm_pool
+from playlist_probe import ProbeCache, ProbeResult, verify_sources
+from playlist_sources import (
+    SourceAdapter,
+    SourceCapabilities,
+    get_source,
+    host_limits,
+    plan_refresh,
+    register_source,
+    source_capabilities,
+    url_ttls,
+)
+from playlist_store import CatalogStore
+from playlist_stats import run_stats
 
 SOURCES_PATH = "./data/playlists"
 TARGET_PATH = "./data/musics.json"
-# 并发限制，防止API过载
-MAX_CONCURRENT_REQUESTS = 5
-# 请求间隔（秒）
-REQUEST_DELAY = 0.5
+# 每次运行的请求统计报告
+REPORT_PATH = "./.cache/reports/playlist_dump.json"
+# 每个来源的批大小、批次并发和上游主机限流由来源适配器声明（见 NcmSource、QqSource）
+# 每批歌曲获取歌词的并发数
+LYRIC_WORKERS = 8
+# 刷新模式重新解析在这段时间（秒）内过期的音频地址
+REFRESH_AHEAD = 6 * 3600
+# 刷新模式每次运行最多发出的解析请求数
+REFRESH_BUDGET = 20
+# 上游确认不可用的歌曲（已下架，或不会过期的音频地址已失效）在这段时间（秒）内不再请求
+UNAVAILABLE_TTL = 7 * 24 * 3600
+
+# 网易云接口路径，请求发往 playlist_mirrors.ncm_pool 中当前最快的健康镜像
+# 歌曲详情接口一次请求可以带上数百个ID
+NCM_DETAIL_PATH = "/api/song/detail"
+NCM_LYRIC_PATH = "/api/song/media?id={mid}"
+# 单次详情请求的最大ID数，一批歌曲会拆成多个详情请求流水线处理
+NCM_DETAIL_BATCH = 200
+# 网易云音频地址按 CDN 上的命名规则拼出，与 playlist_handle 一致
+NCM_SRC_TEMPLATE = "https://cdn.liteyuki.org/snowykami/music/{artist}%20-%20{title}.mp3"
+QQ_SONG_URL = "https://music.api.liteyuki.org/music/?action=qq&module=get_url&mids={mids}"
+QQ_LYRIC_URL = "https://music.api.liteyuki.org/music/?action=qq&module=lyric&mid={mid}"
+# get_url 返回的音频地址带签名，大约一天后失效
+QQ_URL_TTL = 24 * 3600
 
 # 手动包直接解析playlist为列表，抓包在网易云是{}，qq音乐暂时没法抓，只能手动
 # 这里存放一些手动覆写数据，例如某首歌没有歌词时，可以在这里添加其他来源的歌词，以及歌词偏移量
@@ -30,6 +81,10 @@ PREDATA = {
 }
 
 
+# 本次运行中上游明确没有返回的歌曲（补请求后详情仍然缺失），由 download() 记为不可用
+delisted_songs: set[tuple[str, str]] = set()
+
+
 class Song(BaseModel):
     title: str = ""
     artist: str = ""  # name
@@ -45,14 +100,26 @@ class Song(BaseModel):
     alias: list[str] = []
     quality: str = "high"  # 添加quality字段用于音质
     id: str = ""  # 添加id字段用于唯一标识
+    timeline: LyricTimeline | None = None  # 预解析并已应用偏移量的歌词时间轴
+    duration: float | None = None  # 时长（秒），从音频文件头解析
+    bitrate: int | None = None  # 平均比特率（kbps）
+    size: int | None = None  # 文件大小（字节）
+
 
+@dataclass(slots=True)
+class SongInfo:
+    """歌单中的一首歌，只在脚本内部使用，不是 pydantic 模型"""
 
-class SongInfo(BaseModel):
     id: str
     offset: int = 0
     lrcmid: str = ""
     source_type: str = ""
-    alia: list[str] = []  # 添加别名字段，用于存储歌曲的别名列表
+    alia: list[str] = field(default_factory=list)  # 添加别名字段，用于存储歌曲的别名列表
+
+
+# 整个列表一次校验/导出，避免逐个构造和导出模型
+SONG_INFO_LIST = TypeAdapter(list[SongInfo])
+SONG_LIST = TypeAdapter(list[Song])
 
 
 def base64_to_string(base64_str: str) -> str:
@@ -75,73 +142,161 @@ def base64_to_string(base64_str: str) -> str:
             return "[无法解析的歌词]"
 
 
-async def fetch_lyric_from_ncm_official(mid: str) -> str | None:
-    """从网易云音乐官方API获取歌词"""
+async def fetch_lyric_from_ncm_mirror(
+    client: httpx.AsyncClient, mirror: MirrorHealth, mid: str
+) -> str | None:
+    """从指定镜像获取网易云音乐歌词，失败时返回 None"""
     try:
-        async with httpx.AsyncClient(
-            timeout=10.0,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.110 Safari/537.36"
-            },
-        ) as client:
-            lrc_response = await client.get(
-                f"https://ncm.api.liteyuki.org/api/song/media?id={mid}"
-            )
-            lrc_response.raise_for_status()
-            lrc_data = json.loads(lrc_response.text)
-            if lrc_data.get("nolyric", False):
-                return "[00:00.00]music.pure"
-            # 检查返回数据结构
-            if "lyric" in lrc_data and lrc_data["lyric"]:
-                return lrc_data["lyric"]  # 官方API直接返回文本，不需要base64解码
-            return None
+        lrc_response = await ncm_pool.attempt(
+            client, mirror, NCM_LYRIC_PATH.format(mid=mid)
+        )
+        lrc_response.raise_for_status()
+        lrc_data = json_codec.loads(lrc_response.content)
+        if lrc_data.get("nolyric", False):
+            return PURE_MUSIC_LRC
+        # 检查返回数据结构
+        if "lyric" in lrc_data and lrc_data["lyric"]:
+            return lrc_data["lyric"]  # 官方API直接返回文本，不需要base64解码
+        return None
     except Exception as e:
-        print(f"官方API调用出错: {mid} - {e}")
+        print(f"{mirror.host} 镜像歌词获取出错: {mid} - {e}")
         return None
 
 
 async def fetch_lyric_from_ncm(
+    client: httpx.AsyncClient,
     mid: str,
-    channel: Literal["liteyuki", "official", "both"] = "both",
     max_retries: int = 3,
 ) -> str:
-    """从网易云音乐获取歌词，支持重试和多渠道
+    """从网易云音乐获取歌词，支持重试和多镜像
+
+    按镜像池当前的排名依次对冲请求：先请求最快的健康镜像，超过其 p95 延迟仍未返回
+    或请求失败时立即向下一个镜像发出对冲请求，取先返回的有效结果并取消其余请求。
+    熔断中的镜像不参与，冷却结束后先用一个请求探测。
 
     Args:
+        client: 复用的连接池客户端
         mid: 歌曲ID
-        channel: 获取渠道，可选 "official"(官方)、"liteyuki"(第三方)或"both"(两者都尝试)，默认both
-        max_retries: 最大重试次数，默认5次
+        max_retries: 所有镜像都失败后的最大重试次数，默认3次
+    """
+    retries = 0
+    while True:
+        mirrors = ncm_pool.ranked()
+        lrc = await hedge(
+            [
+                partial(fetch_lyric_from_ncm_mirror, client, mirror, mid)
+                for mirror in mirrors
+            ],
+            [mirror.tracker.threshold() for mirror in mirrors],
+        )
+        if lrc:
+            return lrc
+        if retries >= max_retries:
+            return ""
+        retries += 1
+        run_stats.record_retry(ncm_pool.host)
+        await asyncio.sleep(1 * (2**retries))  # 指数退避策略
+
+
+async def fetch_lyric_from_qq(
+    client: httpx.AsyncClient, mid: str, max_retries: int = 3
+) -> str:
+    """从QQ音乐获取歌词，接口返回 Base64 编码的歌词时自动解码
+
+    Args:
+        client: 复用的连接池客户端
+        mid: 歌词对应的歌曲 mid
+        max_retries: 最大重试次数，默认3次
+
+    Returns:
+        歌词文本，没有歌词或多次失败后返回空字符串
     """
-    # 优先尝试官方渠道
-    if channel == "official" or channel == "both":
-        retries = 0
-        while retries <= max_retries:
-            lrc = await fetch_lyric_from_ncm_official(mid)
-            if lrc:
-                return lrc
+    retries = 0
+    while True:
+        try:
+            response = await client.get(QQ_LYRIC_URL.format(mid=mid), timeout=30.0)
+            response.raise_for_status()
+            data = json_codec.loads(response.content)
+            payload = data.get("data") or data
+            lyric = payload.get("lyric", "") if isinstance(payload, dict) else ""
+            if not lyric:
+                return ""
+            # 已经是 LRC 文本时不再解码
+            if lyric.lstrip().startswith("["):
+                return lyric
+            return base64_to_string(lyric)
+        except Exception as e:
+            if retries >= max_retries:
+                print(f"获取QQ音乐歌词出错，已达最大重试次数: {mid} - {e}")
+                return ""
+            retries += 1
+            run_stats.record_retry(httpx.URL(QQ_LYRIC_URL).host)
+            await asyncio.sleep(1 * (2**retries))  # 指数退避策略
 
+
+async def fetch_qq_song_data(
+    client: httpx.AsyncClient, mids: list[str], max_retries: int = 3
+) -> list[dict]:
+    """调用 get_url 接口批量获取QQ音乐歌曲信息和带签名的音频地址，支持重试机制
+
+    Returns:
+        接口返回的歌曲信息，只包含请求的 mid，多次失败后返回空列表
+    """
+    mids_str = ",".join(mids)
+    retries = 0
+    while True:
+        try:
+            song_response = await client.get(
+                QQ_SONG_URL.format(mids=mids_str),
+                timeout=60.0,
+            )
+            song_response.raise_for_status()
+            song_data = song_response.json()
+
+            if not song_data.get("data"):
+                if retries < max_retries:
+                    retries += 1
+                    run_stats.record_retry(song_response.url.host)
+                    wait_time = 1 * (2**retries)  # 指数退避策略
+                    print(
+                        f"获取QQ音乐歌曲信息失败: 数据为空，第{retries}次重试 (等待{wait_time}秒)"
+                    )
+                    await asyncio.sleep(wait_time)
+                    continue
+                else:
+                    print(f"获取QQ音乐歌曲信息失败: 数据为空 - {song_data}")
+                    return []
+
+            wanted_mids = set(mids)
+            return [
+                song_info
+                for song_info in song_data["data"]
+                if str(song_info.get("mid", "")) in wanted_mids
+            ]
+
+        except Exception as e:
             if retries < max_retries:
                 retries += 1
+                run_stats.record_retry(httpx.URL(QQ_SONG_URL).host)
                 wait_time = 1 * (2**retries)  # 指数退避策略
-                # print(f"官方API歌词获取失败，第{retries}次重试 (等待{wait_time}秒): {mid}")
+                print(
+                    f"批量获取QQ音乐歌曲信息出错，第{retries}次重试 (等待{wait_time}秒): {e}"
+                )
                 await asyncio.sleep(wait_time)
             else:
-                # print(f"官方API歌词获取失败，已达最大重试次数: {mid}")
-                # 如果只使用官方渠道，则返回空；否则尝试liteyuki渠道
-                if channel == "official":
-                    return ""
-                break  # 跳出循环，尝试liteyuki渠道
-
-    return ""
+                print(f"批量获取QQ音乐歌曲信息出错，已达最大重试次数: {e}")
+                return []
 
 
 async def fetch_songs_from_qqmusic(
+    client: httpx.AsyncClient,
     mids: list[str],
     offset_map: dict[str, int] | None = None,
     lrcmid_map: dict[str, str] | None = None,
     max_retries: int = 3,
+    lyric_cache: LyricCache | None = None,
 ) -> list[Song]:
-    """批量从QQ音乐获取歌曲信息，支持重试机制"""
+    """批量从QQ音乐获取歌曲信息和歌词"""
     if not mids:
         return []
 
@@ -149,336 +304,814 @@ async def fetch_songs_from_qqmusic(
     lrcmid_map = lrcmid_map or {}
 
     print(f"Fetching {len(mids)} songs from QQ Music")
-    mids_str = ",".join(mids)
 
-    retries = 0
-    last_error = None
+    # 先过滤出有音频源的歌曲，只为这些歌曲获取歌词
+    songs: list[Song] = []
+    for song_info in await fetch_qq_song_data(client, mids, max_retries):
+        mid = str(song_info.get("mid", ""))
+
+        # 检查是否有有效的音频源链接
+        src = song_info.get("url", "").replace("http://", "https://")
+        if not src:
+            print(
+                f"跳过没有音频源的歌曲: {song_info.get('song', 'Unknown')} (ID: {mid})"
+            )
+            continue
+
+        songs.append(
+            Song(
+                id=mid,
+                title=song_info.get("song", "Unknown"),
+                album=song_info.get("album", "Unknown Album"),
+                artist=song_info.get("singer", "Unknown Artist"),
+                src=src,
+                cover=song_info.get("cover", ""),
+                source="qq",
+                songLink=song_info.get("link", ""),
+                offset=offset_map.get(mid, 0),
+            )
+        )
+
+    # 歌词通过来源适配器的 fetch_lyric 有限并发获取
+    await get_source("qq").attach_lyrics(
+        client, songs, lrcmid_map, LYRIC_WORKERS, lyric_cache
+    )
+    return songs
+
+
+def build_ncm_song(
+    detail: dict, offset: int = 0, alias: list[str] | None = None
+) -> Song:
+    """把网易云详情接口返回的一首歌转换为 Song，兼容新旧两种字段名（ar/al 与 artists/album）"""
+    song_id = str(detail.get("id", ""))
+    artists = detail.get("ar") or detail.get("artists") or []
+    album = detail.get("al") or detail.get("album") or {}
+    title = detail.get("name") or "Unknown"
+    artist = ",".join(a.get("name", "") for a in artists) or "Unknown Artist"
+
+    # 歌单中手动填写的别名排在接口返回的别名之后
+    merged_alias = list(detail.get("alia") or detail.get("alias") or [])
+    for alia in alias or []:
+        if alia not in merged_alias:
+            merged_alias.append(alia)
+
+    return Song(
+        id=song_id,
+        title=title,
+        artist=artist,
+        album=album.get("name") or "Unknown Album",
+        src=NCM_SRC_TEMPLATE.format(artist=quote(artist), title=quote(title)),
+        cover=(album.get("picUrl") or "").replace("http://", "https://"),
+        source="ncm",
+        songLink=f"https://music.163.com/#/song?id={song_id}",
+        albumLink=f"https://music.163.com/#/album?id={album['id']}" if album.get("id") else "",
+        artistLink=(
+            f"https://music.163.com/#/artist?id={artists[0]['id']}"
+            if artists and artists[0].get("id")
+            else ""
+        ),
+        alias=merged_alias,
+        offset=offset,
+    )
+
+
+async def fetch_ncm_details(
+    client: httpx.AsyncClient, ids: list[str], max_retries: int = 3
+) -> dict[str, dict]:
+    """用一次详情请求获取一组网易云歌曲的信息
+
+    请求失败时按指数退避重试。上游只返回了部分歌曲时，缺失的ID再单独请求一次，
+    仍然缺失的（通常是已下架的歌曲）记入 songs.missing 和 delisted_songs 并跳过。
+
+    Args:
+        client: 复用的连接池客户端
+        ids: 歌曲ID，数量不超过 NCM_DETAIL_BATCH
+        max_retries: 请求失败时的最大重试次数，默认3次
 
-    while retries <= max_retries:
+    Returns:
+        歌曲ID到详情的映射，不包含缺失的歌曲
+    """
+    details: dict[str, dict] = {}
+    missing = list(ids)
+    retries = 0
+    partial_retried = False
+    while missing:
         try:
-            async with httpx.AsyncClient(
+            response = await ncm_pool.get(
+                client,
+                NCM_DETAIL_PATH,
+                params={"ids": f"[{','.join(missing)}]"},
                 timeout=60.0,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.110 Safari/537.36"
-                },
-            ) as client:
-                song_response = await client.get(
-                    f"https://music.api.liteyuki.org/music/?action=qq&module=get_url&mids={mids_str}"
-                )
-                song_response.raise_for_status()
-                song_data = song_response.json()
+            )
+            response.raise_for_status()
+            data = json_codec.loads(response.content)
+            if data.get("code", 200) != 200:
+                raise ValueError(f"接口返回 code={data.get('code')}")
+            wanted = set(missing)
+            for detail in data.get("songs") or []:
+                song_id = str(detail.get("id", ""))
+                if song_id in wanted:
+                    details[song_id] = detail
+            missing = [song_id for song_id in missing if song_id not in details]
+            # 部分响应不会被 HTTP 缓存保存，补请求会到达上游；仍然缺失的通常已下架，只补请求一次
+            if not missing:
+                break
+            if partial_retried:
+                delisted_songs.update(("ncm", song_id) for song_id in missing)
+                break
+            partial_retried = True
+            print(f"网易云歌曲详情缺少 {len(missing)} 首，单独请求缺失的ID")
+        except Exception as e:
+            if retries >= max_retries:
+                print(f"获取网易云歌曲详情出错，已达最大重试次数: {e}")
+                break
+            retries += 1
+            run_stats.record_retry(ncm_pool.host)
+            wait_time = 1 * (2**retries)  # 指数退避策略
+            print(
+                f"获取网易云歌曲详情出错，第{retries}次重试 (等待{wait_time}秒): {e}"
+            )
+            await asyncio.sleep(wait_time)
 
-                if not song_data.get("data"):
-                    if retries < max_retries:
-                        retries += 1
-                        wait_time = 1 * (2**retries)  # 指数退避策略
-                        print(
-                            f"获取QQ音乐歌曲信息失败: 数据为空，第{retries}次重试 (等待{wait_time}秒)"
-                        )
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        print(f"获取QQ音乐歌曲信息失败: 数据为空 - {song_data}")
-                        return []
+    if missing:
+        run_stats.count("songs.missing", len(missing))
+        print(f"跳过 {len(missing)} 首没有详情的网易云歌曲: {', '.join(missing)}")
+    return details
 
-                songs = []
 
-                # 创建任务列表获取歌词
-                lyric_tasks = {}
-                for mid in mids:
-                    lyric_mid = lrcmid_map.get(mid, mid)
-                    lyric_tasks[mid] = asyncio.create_task(
-                        fetch_lyric_from_qq(lyric_mid)
-                    )
+async def fetch_songs_from_ncm(
+    client: httpx.AsyncClient,
+    mids: list[str],
+    offset_map: dict[str, int] | None = None,
+    lrcmid_map: dict[str, str] | None = None,
+    alias_data: dict[str, list[str]] | None = None,
+    max_retries: int = 3,
+    lyric_cache: LyricCache | None = None,
+) -> list[Song]:
+    """批量从网易云音乐获取歌曲信息
 
-                # 创建歌曲对象列表
-                for song_info in song_data["data"]:
-                    mid = str(song_info.get("mid", ""))
-                    if not mid or mid not in mids:
-                        continue
+    ID 按 NCM_DETAIL_BATCH 拆成若干个详情请求并发发出，每个详情请求返回后
+    立即开始获取这部分歌曲的歌词，详情和歌词请求流水线执行，不必等整批详情返回。
 
-                    # 检查是否有有效的音频源链接
-                    src = song_info.get("url", "").replace("http://", "https://")
-                    if not src:
-                        print(
-                            f"跳过没有音频源的歌曲: {song_info.get('song', 'Unknown')} (ID: {mid})"
-                        )
-                        continue
-
-                    # 等待对应的歌词任务完成
-                    lrc = ""
-                    if mid in lyric_tasks:
-                        try:
-                            lrc = await lyric_tasks[mid]
-                            if lrc == "":
-                                print(
-                                    f"可能是纯音乐: {song_info.get('song', 'Unknown')} - {song_info.get('singer', 'Unknown Artist')} (ID: {mid})"
-                                )
-                        except Exception as e:
-                            print(f"获取QQ音乐歌词出错: {mid} - {e}")
-
-                    song = Song(
-                        id=mid,
-                        title=song_info.get("song", "Unknown"),
-                        album=song_info.get("album", "Unknown Album"),
-                        artist=song_info.get("singer", "Unknown Artist"),
-                        src=src,
-                        lrc=lrc,
-                        cover=song_info.get("cover", ""),
-                        source="qq",
-                        songLink=song_info.get("link", ""),
-                        offset=offset_map.get(mid, 0),
-                    )
-                    songs.append(song)
+    Args:
+        client: 复用的连接池客户端
+        mids: 歌曲ID
+        offset_map: 歌曲ID到歌词偏移量的映射
+        lrcmid_map: 歌曲ID到歌词来源ID的映射，没有时使用歌曲本身的ID
+        alias_data: 歌曲ID到歌单中手动填写的别名的映射
+        max_retries: 单个请求的最大重试次数，默认3次
+        lyric_cache: 本地歌词缓存
+
+    Returns:
+        获取到详情的歌曲，顺序与 mids 一致
+    """
+    if not mids:
+        return []
 
-                return songs
+    offset_map = offset_map or {}
+    lrcmid_map = lrcmid_map or {}
+    alias_data = alias_data or {}
+
+    print(f"Fetching {len(mids)} songs from NCM")
+
+    async def fetch_part(ids: list[str]) -> list[Song]:
+        details = await fetch_ncm_details(client, ids, max_retries)
+        songs = [
+            build_ncm_song(details[song_id], offset_map.get(song_id, 0), alias_data.get(song_id))
+            for song_id in ids
+            if song_id in details
+        ]
+        # 这部分歌曲的详情一返回就开始获取歌词，与其他详情请求并行
+        await get_source("ncm").attach_lyrics(
+            client, songs, lrcmid_map, LYRIC_WORKERS, lyric_cache
+        )
+        return songs
 
-        except Exception as e:
-            last_error = e
-            if retries < max_retries:
-                retries += 1
-                wait_time = 1 * (2**retries)  # 指数退避策略
-                print(
-                    f"批量获取QQ音乐歌曲信息出错，第{retries}次重试 (等待{wait_time}秒): {e}"
+    parts = await asyncio.gather(
+        *(
+            fetch_part(mids[i : i + NCM_DETAIL_BATCH])
+            for i in range(0, len(mids), NCM_DETAIL_BATCH)
+        )
+    )
+    return [song for part in parts for song in part]
+
+
+class NcmSource(SourceAdapter):
+    """网易云音乐：详情接口支持数百个ID的批量请求，音频地址按 CDN 命名规则拼出，不会过期"""
+
+    name = "ncm"
+    capabilities = SourceCapabilities(
+        max_batch=500,
+        max_in_flight=4,
+        # 镜像池的主机与 playlist_handle 共用，限流配置在 playlist_http.HOST_LIMITS 中
+    )
+
+    async def fetch_songs(
+        self,
+        client: httpx.AsyncClient,
+        songs_info: list[SongInfo],
+        lyric_cache: LyricCache | None = None,
+    ) -> list[Song]:
+        return await fetch_songs_from_ncm(
+            client,
+            [info.id for info in songs_info],
+            {info.id: info.offset for info in songs_info},
+            {info.id: info.lrcmid for info in songs_info if info.lrcmid},
+            alias_data={info.id: info.alia for info in songs_info if info.alia},
+            lyric_cache=lyric_cache,
+        )
+
+    async def fetch_lyric(self, client: httpx.AsyncClient, mid: str) -> str:
+        return await fetch_lyric_from_ncm(client, mid)
+
+    async def resolve_urls(
+        self, client: httpx.AsyncClient, ids: list[str]
+    ) -> dict[str, str]:
+        urls: dict[str, str] = {}
+        for i in range(0, len(ids), NCM_DETAIL_BATCH):
+            details = await fetch_ncm_details(client, ids[i : i + NCM_DETAIL_BATCH])
+            for song_id, detail in details.items():
+                urls[song_id] = build_ncm_song(detail).src
+        return urls
+
+
+class QqSource(SourceAdapter):
+    """QQ音乐：get_url 接口每次最多约100首，返回的音频地址带签名、会过期"""
+
+    name = "qq"
+    capabilities = SourceCapabilities(
+        max_batch=100,
+        max_in_flight=4,
+        host_limits={
+            "music.api.liteyuki.org": HostLimit(rate=4.0, burst=4, max_in_flight=4),
+        },
+        urls_expire=True,
+        url_ttl=QQ_URL_TTL,
+    )
+
+    async def fetch_songs(
+        self,
+        client: httpx.AsyncClient,
+        songs_info: list[SongInfo],
+        lyric_cache: LyricCache | None = None,
+    ) -> list[Song]:
+        return await fetch_songs_from_qqmusic(
+            client,
+            [info.id for info in songs_info],
+            {info.id: info.offset for info in songs_info},
+            {info.id: info.lrcmid for info in songs_info if info.lrcmid},
+            lyric_cache=lyric_cache,
+        )
+
+    async def fetch_lyric(self, client: httpx.AsyncClient, mid: str) -> str:
+        return await fetch_lyric_from_qq(client, mid)
+
+    async def resolve_urls(
+        self, client: httpx.AsyncClient, ids: list[str]
+    ) -> dict[str, str]:
+        urls: dict[str, str] = {}
+        for i in range(0, len(ids), self.capabilities.max_batch):
+            for song_info in await fetch_qq_song_data(
+                client, ids[i : i + self.capabilities.max_batch]
+            ):
+                src = song_info.get("url", "").replace("http://", "https://")
+                if src:
+                    urls[str(song_info["mid"])] = src
+        return urls
+
+
+register_source(NcmSource())
+register_source(QqSource())
+
+
+def parse_tracks(json_obj: dict) -> list[dict]:
+    """解析歌单文件中的歌曲，合并 PREDATA 中的覆写信息"""
+    source_type = json_obj.get("type", "")  # 可能是"ncm"或"qq"
+    if not source_type:
+        raise ValueError("缺少类型信息")
+
+    tracks = []
+    for track in json_obj.get("playlist", {}).get("tracks", []):
+        track_id = str(track.get("id", ""))
+        if not track_id:
+            continue
+
+        # 从 PREDATA 或歌单数据中获取偏移量和歌词 ID
+        offset = track.get("offset", PREDATA.get(track_id, {}).get("offset", 0))
+        lrcmid = track.get("lrcmid", PREDATA.get(track_id, {}).get("lrcmid", ""))
+
+        tracks.append(
+            {
+                "id": track_id,
+                "offset": offset,
+                "lrcmid": lrcmid,
+                "source_type": source_type,
+                "alia": track.get("alia", []),  # 获取别名列表
+            }
+        )
+    return tracks
+
+
+async def load_playlists(
+    manifest: PlaylistManifest, use_manifest: bool = True
+) -> tuple[dict[str, list[SongInfo]], bool]:
+    """读取所有歌单文件，未变化的文件直接使用清单中记录的歌曲
+
+    每个文件的歌曲单独整体校验，解析或校验失败的文件沿用上次成功解析的歌曲，
+    不影响其他歌单，它贡献的歌曲也不会被当作不再引用而移除。
+
+    Args:
+        manifest: 歌单清单，会被更新为本次扫描的结果
+        use_manifest: 为 False 时忽略清单，重新解析所有歌单文件
+
+    Returns:
+        每个歌单文件的歌曲列表，以及是否有歌单文件新增、修改或删除
+    """
+    filenames = sorted(f for f in os.listdir(SOURCES_PATH) if f.endswith(".json"))
+    changed = False
+    for filename in manifest.retain(set(filenames)):
+        print(f"歌单文件已删除: {filename}")
+        changed = True
+
+    playlists: dict[str, list[SongInfo]] = {}
+    for filename in filenames:
+        file_path = os.path.join(SOURCES_PATH, filename)
+        previous = manifest.entry(filename)
+        old_tracks = manifest.tracks(filename)
+        old_keys = {(t["source_type"], t["id"]) for t in old_tracks}
+        try:
+            if use_manifest and manifest.is_unchanged(filename, file_path):
+                playlists[filename] = SONG_INFO_LIST.validate_python(
+                    manifest.tracks(filename)
                 )
-                await asyncio.sleep(wait_time)
-            else:
-                print(f"批量获取QQ音乐歌曲信息出错，已达最大重试次数: {e}")
-                return []
+                continue
 
-    print(f"批量获取QQ音乐歌曲信息失败: {last_error}")
-    return []
+            content, unchanged = await manifest.read(filename, file_path)
+            if use_manifest and unchanged:
+                playlists[filename] = SONG_INFO_LIST.validate_python(
+                    manifest.tracks(filename)
+                )
+                continue
 
+            print(f"处理歌单文件: {filename}")
+            tracks = parse_tracks(json_codec.loads(content))
+            songs_info = SONG_INFO_LIST.validate_python(tracks)
+        except Exception as e:
+            print(f"处理歌单文件 {filename} 出错: {e}")
+            changed = True
+            try:
+                old_songs_info = SONG_INFO_LIST.validate_python(old_tracks)
+            except ValueError:
+                # 清单中的记录本身无法校验，只能丢弃
+                manifest.restore(filename, None)
+                continue
+            manifest.restore(filename, previous)
+            if old_songs_info:
+                print(f"沿用歌单文件 {filename} 上次成功解析的 {len(old_songs_info)} 首歌曲")
+                playlists[filename] = old_songs_info
+            continue
 
-async def process_chunk(
-    songs_info: list[SongInfo], existing_song_ids: set[str], force: bool = False
-) -> list[Song]:
-    """处理一批歌曲信息"""
-    # 首先过滤掉已存在的歌曲
-    if not force:
-        filtered_songs_info = []
-        skipped_count = 0
-        for song_info in songs_info:
-            if song_info.id in existing_song_ids:
-                print(f"跳过已存在的歌曲: {song_info.id}")
-                skipped_count += 1
-            else:
-                filtered_songs_info.append(song_info)
+        manifest.set_tracks(filename, tracks)
+        playlists[filename] = songs_info
+        changed = True
+        new_keys = {(t["source_type"], t["id"]) for t in tracks}
+        print(
+            f"歌单文件 {filename}: 新增 {len(new_keys - old_keys)} 首，移除 {len(old_keys - new_keys)} 首"
+        )
+    return playlists, changed
+
+
+def attach_timeline(song: dict) -> None:
+    """为还没有时间轴的歌曲解析歌词，偏移量在这里一次性应用"""
+    if song.get("timeline") is None and song.get("lrc"):
+        song["timeline"] = parse_lrc(song["lrc"], song.get("offset", 0)).model_dump()
+
+
+def plan_songs(songs_info: list[SongInfo]) -> list[SongInfo]:
+    """按 (来源, ID) 去重，合并同一首歌在多个歌单中的覆写信息
+
+    偏移量和歌词ID取第一个非默认值，别名取并集，保持首次出现的顺序。
+    """
+    planned: dict[tuple[str, str], SongInfo] = {}
+    for song_info in songs_info:
+        key = (song_info.source_type, song_info.id)
+        merged = planned.get(key)
+        if merged is None:
+            planned[key] = replace(song_info, alia=list(song_info.alia))
+            continue
+        if not merged.offset and song_info.offset:
+            merged.offset = song_info.offset
+        if not merged.lrcmid and song_info.lrcmid:
+            merged.lrcmid = song_info.lrcmid
+        for alia in song_info.alia:
+            if alia not in merged.alia:
+                merged.alia.append(alia)
+    return list(planned.values())
+
+
+def build_batches(songs_info: list[SongInfo]) -> list[list[SongInfo]]:
+    """按来源分组后再切批，每批大小为对应来源声明的最大批量"""
+    by_source: dict[str, list[SongInfo]] = {}
+    for song_info in songs_info:
+        by_source.setdefault(song_info.source_type, []).append(song_info)
 
-        if skipped_count > 0:
-            print(f"共跳过 {skipped_count} 首已存在歌曲")
+    batches: list[list[SongInfo]] = []
+    for source_type, source_songs in by_source.items():
+        batch_size = source_capabilities(source_type).max_batch
+        for i in range(0, len(source_songs), batch_size):
+            batches.append(source_songs[i : i + batch_size])
+    return batches
 
-        songs_info = filtered_songs_info
 
-    # 如果所有歌曲都被过滤，直接返回空列表
+async def process_chunk(
+    client: httpx.AsyncClient,
+    songs_info: list[SongInfo],
+    lyric_cache: LyricCache | None = None,
+) -> list[Song]:
+    """用对应来源的适配器处理一批歌曲，批次由 build_batches() 切分，只包含一个来源
+
+    已存在歌曲的过滤在 download() 的规划阶段完成。
+    """
     if not songs_info:
         return []
 
-    # 按来源分组
-    ncm_songs = []
-    qq_songs = []
+    source_type = songs_info[0].source_type
+    source = get_source(source_type)
+    if source is None:
+        print(f"未知的歌曲来源: {source_type}，跳过 {len(songs_info)} 首歌曲")
+        return []
 
-    ncm_mids = []
-    qq_mids = []
-    alias_data: dict[str, list[str]] = {}
-    ncm_offsets = {}
-    qq_offsets = {}
-    ncm_lrcmids = {}
-    qq_lrcmids = {}
+    try:
+        return await source.fetch_songs(client, songs_info, lyric_cache)
+    except Exception as e:
+        print(f"获取歌曲失败: {source_type} - {e}")
+        return []
 
-    for song_info in songs_info:
-        if song_info.source_type == "ncm":
-            ncm_songs.append(song_info)
-            ncm_mids.append(song_info.id)
-            ncm_offsets[song_info.id] = song_info.offset
-            if song_info.lrcmid:
-                ncm_lrcmids[song_info.id] = song_info.lrcmid
-            if song_info.alia:
-                alias_data[song_info.id] = song_info.alia
-        elif song_info.source_type == "qq":
-            qq_songs.append(song_info)
-            qq_mids.append(song_info.id)
-            qq_offsets[song_info.id] = song_info.offset
-            if song_info.lrcmid:
-                qq_lrcmids[song_info.id] = song_info.lrcmid
-
-    # 创建任务
-    tasks = []
-    if ncm_mids:
-        tasks.append(fetch_songs_from_ncm(ncm_mids, ncm_offsets, ncm_lrcmids, alias_data=alias_data))
-    if qq_mids:
-        tasks.append(fetch_songs_from_qqmusic(qq_mids, qq_offsets, qq_lrcmids))
-
-    # 并发执行任务
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    # 处理结果
-    songs: list[Song] = []
-    for result in results:
-        if isinstance(result, Exception):
-            print(f"获取歌曲失败: {result}")
-        elif isinstance(result, list):
-            songs.extend(result)
-        else:
-            print(f"未知类型的结果: {type(result)}，已跳过")
 
-    return songs
+async def refresh_expiring_sources(
+    client: httpx.AsyncClient,
+    store: CatalogStore,
+    budget: int = REFRESH_BUDGET,
+    ahead: float = REFRESH_AHEAD,
+) -> int:
+    """按优先级在请求预算内重新解析即将过期的音频地址
 
+    解析失败或超出预算的歌曲保留原来的地址和过期时间，下次刷新时仍然优先处理。
 
-async def download(force: bool = False, new_playlist: bool = False):
-    """下载所有歌曲信息，支持并发处理"""
-    start_time = time.time()
+    Args:
+        client: 复用的连接池客户端
+        store: 歌曲目录
+        budget: 最多发出的解析请求数
+        ahead: 重新解析在这段时间（秒）内过期的地址
 
-    # 读取现有歌曲
-    existing_song_ids = set()
-    existing_songs = []
-    if not new_playlist:
-        try:
-            if os.path.exists(TARGET_PATH):
-                async with aiofiles.open(TARGET_PATH, "r", encoding="utf-8") as f:
-                    try:
-                        existing_songs = json.loads(await f.read())
-                        # 只保留有音频源的歌曲
-                        valid_existing_songs = []
-                        for song in existing_songs:
-                            if song.get("src"):
-                                valid_existing_songs.append(song)
-                                existing_song_ids.add(song.get("id"))
-                            else:
-                                print(
-                                    f"移除现有没有音频源的歌曲: {song.get('title', 'Unknown')} (ID: {song.get('id', 'Unknown')})"
-                                )
-
-                        existing_songs = valid_existing_songs
-                        print(f"加载了 {len(existing_song_ids)} 首有效现有歌曲")
-                    except json.JSONDecodeError:
-                        print("现有歌曲文件解析失败，将创建新文件")
-                        existing_songs = []
-        except Exception as e:
-            print(f"读取现有歌曲文件出错: {e}")
-            existing_songs = []
-    else:
-        print("创建全新歌单，不保留现有歌曲")
+    Returns:
+        地址发生变化的歌曲数量
+    """
+    candidates = store.expiring_sources(time.time() + ahead)
+    if not candidates:
+        return 0
+    plan = plan_refresh(candidates, budget)
+    print(
+        f"共 {len(candidates)} 个音频地址即将过期，本次刷新 {sum(map(len, plan.values()))} 个"
+    )
+    run_stats.count("sources.expiring", len(candidates))
+
+    results = await asyncio.gather(
+        *(get_source(source).resolve_urls(client, ids) for source, ids in plan.items()),
+        return_exceptions=True,
+    )
+    changed = 0
+    for (source, ids), urls in zip(plan.items(), results):
+        if isinstance(urls, BaseException):
+            print(f"刷新 {source} 音频地址出错，保留原地址: {urls}")
+            continue
+        if len(urls) < len(ids):
+            print(f"{len(ids) - len(urls)} 个 {source} 音频地址刷新失败，保留原地址")
+        changed += store.refresh_sources(source, urls)
+        run_stats.count("sources.refreshed", len(urls))
+    return changed
+
+
+async def download(
+    force: bool = False,
+    new_playlist: bool = False,
+    resume: bool = False,
+    sharded: bool = False,
+    compact: bool = False,
+    verify: bool = True,
+    refresh: bool = False,
+    refresh_budget: int = REFRESH_BUDGET,
+):
+    """下载所有歌曲信息，支持并发处理
 
-    all_songs_info = []
+    Args:
+        force: 强制重新下载已存在的歌曲
+        new_playlist: 不保留现有歌曲
+        resume: 回放上次中断时的日志，只处理尚未完成的歌曲
+        sharded: 同时输出按需加载的分片格式（索引 + 歌词分片），见 playlist_catalog
+        compact: musics.json 输出为不带缩进的紧凑格式
+        verify: 探测所有音频源，移除失效的歌曲并读取时长等元数据，见 playlist_probe 和 playlist_audio_meta
+        refresh: 重新解析即将过期的音频地址（例如QQ音乐的签名地址），其余歌曲保持不变
+        refresh_budget: 刷新模式最多发出的解析请求数
+    """
+    start_time = time.time()
+    delisted_songs.clear()
 
-    # 读取所有歌单文件
     if not os.path.exists(SOURCES_PATH):
         print(f"目录 {SOURCES_PATH} 不存在")
         return
 
-    for filename in os.listdir(SOURCES_PATH):
-        if not filename.endswith(".json"):
-            continue
+    # 读取所有歌单文件，未变化的文件直接复用清单中的记录
+    # 盐值固定用标准库计算，切换 JSON 后端不会让清单失效；输出格式变化时需要重写歌曲文件
+    manifest = PlaylistManifest(
+        salt=hashlib.sha256(
+            json.dumps({"predata": PREDATA, "compact": compact}, sort_keys=True).encode()
+        ).hexdigest()
+    )
+    playlists, changed = await load_playlists(manifest, use_manifest=not force)
+    if (
+        not (changed or force or new_playlist or resume or refresh)
+        and not manifest.pending
+        and not manifest.retry_due(start_time)
+        and manifest.catalog_unchanged(TARGET_PATH)
+        and not (sharded and not os.path.exists(SHARDED_PATH))
+    ):
+        print("歌单文件和歌曲文件都没有变化，无需处理")
+        print(f"耗时 {time.time() - start_time:.3f} 秒")
+        return
 
-        file_path = os.path.join(SOURCES_PATH, filename)
-        print(f"处理歌单文件: {filename}")
+    # 歌曲目录以 SQLite 为工作存储，整次运行的修改在导出成功后才提交
+    # 会过期的音频地址按来源声明的有效期记录过期时间
+    with CatalogStore(url_ttls=url_ttls()) as store:
+        if new_playlist:
+            store.clear()
+            print("创建全新歌单，不保留现有歌曲")
+        elif os.path.exists(TARGET_PATH) and (
+            store.count() == 0 or not manifest.catalog_unchanged(TARGET_PATH)
+        ):
+            # 首次运行或 musics.json 被外部修改过，以文件内容为准重新导入
+            try:
+                async with aiofiles.open(TARGET_PATH, "rb") as f:
+                    existing_songs = json_codec.loads(await f.read())
+                valid_existing_songs = []
+                for song in existing_songs:
+                    # 只保留有音频源的歌曲
+                    if song.get("src"):
+                        attach_timeline(song)
+                        valid_existing_songs.append(song)
+                    else:
+                        print(
+                            f"移除现有没有音频源的歌曲: {song.get('title', 'Unknown')} (ID: {song.get('id', 'Unknown')})"
+                        )
+                del existing_songs
+                store.load(valid_existing_songs)
+                print(f"从 {TARGET_PATH} 导入了 {len(valid_existing_songs)} 首有效现有歌曲")
+            except ValueError:
+                print("现有歌曲文件解析失败，将创建新文件")
+                store.clear()
+            except Exception as e:
+                print(f"读取现有歌曲文件出错: {e}")
+                store.clear()
+        print(f"目录中共有 {store.count()} 首现有歌曲")
+
+        # 不再被任何歌单引用的歌曲会从目录中移除
+        store.set_playlists(
+            {
+                filename: [(info.source_type, info.id) for info in songs_info]
+                for filename, songs_info in playlists.items()
+            }
+        )
+        unreferenced_count = store.prune_unreferenced()
+        if unreferenced_count > 0:
+            print(f"移除 {unreferenced_count} 首不再被歌单引用的歌曲")
+        existing_keys = store.keys()
+
+        all_songs_info = [
+            info for songs_info in playlists.values() for info in songs_info
+        ]
+        print(f"歌单中共有 {len(all_songs_info)} 首歌曲")
+
+        # 规划阶段：全局去重，再过滤掉已存在的歌曲
+        all_songs_info = plan_songs(all_songs_info)
+        planned_keys = {(info.source_type, info.id) for info in all_songs_info}
+        print(f"去重后共 {len(all_songs_info)} 首歌曲")
+        # 等待期内的不可用歌曲不再请求，强制模式下全部重新尝试
+        unavailable = {
+            key: retry_at
+            for key, retry_at in manifest.unavailable.items()
+            if not force and retry_at > start_time and key in planned_keys
+        }
+        if not force:
+            skipped_count = len(all_songs_info)
+            all_songs_info = [
+                info
+                for info in all_songs_info
+                if (info.source_type, info.id) not in existing_keys
+            ]
+            skipped_count -= len(all_songs_info)
+            if skipped_count > 0:
+                print(f"共跳过 {skipped_count} 首已存在歌曲")
+            skipped_count = len(all_songs_info)
+            all_songs_info = [
+                info
+                for info in all_songs_info
+                if (info.source_type, info.id) not in unavailable
+            ]
+            skipped_count -= len(all_songs_info)
+            if skipped_count > 0:
+                print(f"共跳过 {skipped_count} 首暂时不可用的歌曲")
+        print(f"共找到 {len(all_songs_info)} 首歌曲需要处理")
+        run_stats.count("songs.pending", len(all_songs_info))
+
+        # 每批完成后写入日志，中断后可以用 --resume 继续
+        journal = DumpJournal()
+        all_songs: list[Song] = []
+        if resume:
+            journaled_songs, done_keys = journal.replay()
+            all_songs.extend(SONG_LIST.validate_python(journaled_songs))
+            all_songs_info = [
+                info
+                for info in all_songs_info
+                if (info.source_type, info.id) not in done_keys
+            ]
+            print(
+                f"从日志恢复了 {len(journaled_songs)} 首歌曲，剩余 {len(all_songs_info)} 首需要处理"
+            )
+        journal.open(resume=resume)
 
-        try:
-            async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
-                json_obj = json.loads(await f.read())
-                source_type = json_obj.get("type", "")  # 可能是"ncm"或"qq"
+        # 按来源切批，每批尽量填满对应接口的批量上限
+        batches = build_batches(all_songs_info)
+        print(f"共 {len(batches)} 批请求")
 
-                if not source_type:
-                    print(f"歌单文件 {filename} 缺少类型信息，跳过")
-                    continue
+        # 每个来源同时处理的批次数由其适配器声明，一个来源慢不会占满其他来源的并发
+        source_slots = {
+            source_type: asyncio.Semaphore(source_capabilities(source_type).max_in_flight)
+            for source_type in {chunk[0].source_type for chunk in batches}
+        }
 
-                for track in json_obj.get("playlist", {}).get("tracks", []):
-                    track_id = str(track.get("id", ""))
-                    if not track_id:
-                        continue
+        async def process_and_record(
+            client: httpx.AsyncClient, lyric_cache: LyricCache, chunk: list[SongInfo]
+        ) -> list[Song]:
+            async with source_slots[chunk[0].source_type]:
+                songs = await process_chunk(client, chunk, lyric_cache=lyric_cache)
+            # 只把实际获取到的歌曲记为完成，失败或被丢弃的歌曲在 --resume 时会重新获取
+            if songs:
+                journal.record_chunk(
+                    [(song.source, song.id) for song in songs],
+                    SONG_LIST.dump_python(songs),
+                )
+            return songs
 
-                    # 从 PREDATA 或歌单数据中获取偏移量和歌词 ID
-                    offset = track.get(
-                        "offset", PREDATA.get(track_id, {}).get("offset", 0)
-                    )
-                    lrcmid = track.get(
-                        "lrcmid", PREDATA.get(track_id, {}).get("lrcmid", "")
+        # 整次运行共用一个连接池客户端，歌词优先从本地缓存读取
+        # 所有请求都经过按主机划分的令牌桶（包括各来源声明的主机），429/5xx 时自动降速，上游健康时逐步提速
+        with LyricCache() as lyric_cache, HttpCache() as http_cache:
+            async with create_client(
+                limiter=RateLimiter(host_limits()), stats=run_stats, cache=http_cache
+            ) as client:
+                # 创建任务列表
+                tasks = [
+                    process_and_record(client, lyric_cache, chunk) for chunk in batches
+                ]
+
+                # 处理所有任务
+                try:
+                    chunks_results = await asyncio.gather(*tasks)
+                finally:
+                    journal.close()
+                # 合并结果，从日志恢复的歌曲已经在 all_songs 中，和新获取的歌曲一起探测
+                for chunk_songs in chunks_results:
+                    all_songs.extend(chunk_songs)
+                    run_stats.count("songs.fetched", len(chunk_songs))
+
+                # 刷新模式：重新解析即将过期的音频地址，新地址随后一起被探测
+                # 探测前也会在预算内刷新已经过期的地址，过期的签名地址会返回 403，不能据此判断失效
+                refreshed_count = 0
+                if refresh or verify:
+                    refreshed_count = await refresh_expiring_sources(
+                        client, store, refresh_budget, REFRESH_AHEAD if refresh else 0.0
                     )
-
-                    all_songs_info.append(
-                        SongInfo(
-                            id=track_id,
-                            offset=offset,
-                            lrcmid=lrcmid,
-                            source_type=source_type,
-                            alia=track.get("alia", []),  # 获取别名列表
+                    if refreshed_count > 0:
+                        print(f"刷新了 {refreshed_count} 首歌曲的音频地址")
+                # 超出预算、仍然过期的地址不探测，保留到之后的刷新
+                expired_srcs = store.expired_srcs(time.time())
+
+                # 并发探测目录中和新获取的所有音频源，未过期的探测结果直接复用
+                # 可用的音频源再读取文件头解析时长等元数据，文件没有变化时直接使用缓存
+                probes: dict[str, ProbeResult] = {}
+                metas: dict[str, AudioMeta] = {}
+                if verify:
+                    with ProbeCache() as probe_cache:
+                        probes = await verify_sources(
+                            client,
+                            [src for src in store.sources() if src not in expired_srcs]
+                            + [song.src for song in all_songs if song.src],
+                            probe_cache,
                         )
+                    run_stats.record_cache("probe", probe_cache.hits, probe_cache.misses)
+                    with AudioMetaCache() as meta_cache:
+                        metas = await read_audio_metas(client, probes, meta_cache)
+                    run_stats.record_cache(
+                        "audio_meta", meta_cache.hits, meta_cache.misses
                     )
-        except Exception as e:
-            print(f"处理歌单文件 {filename} 出错: {e}")
-
-    print(f"共找到 {len(all_songs_info)} 首歌曲需要处理")
-
-    # 分批处理，避免一次请求过多
-    batch_size = 10
-    all_songs: list[Song] = []
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
-
-    async def process_with_semaphore(chunk):
-        async with semaphore:
-            result = await process_chunk(chunk, existing_song_ids, force)
-            # 添加延迟，避免API限流
-            await asyncio.sleep(REQUEST_DELAY)
-            return result
-
-    # 创建任务列表
-    tasks = []
-    for i in range(0, len(all_songs_info), batch_size):
-        chunk = all_songs_info[i : i + batch_size]
-        tasks.append(process_with_semaphore(chunk))
-
-    # 处理所有任务
-    chunks_results = await asyncio.gather(*tasks)
-
-    # 合并结果
-    for chunk_songs in chunks_results:
-        all_songs.extend(chunk_songs)
-
-    # 保存结果
-    if all_songs:
-        # 合并新歌曲和现有歌曲
-        combined_songs = []
-        existing_song_dict = {
-            song.get("id"): song for song in existing_songs if song.get("id")
-        }
-
-        # 添加新歌曲，不替换现有的同ID歌曲（除非使用force模式）
-        skipped_count = 0
-        replaced_count = 0
+            lyric_cache.record_stats(run_stats)
+            http_cache.record_stats(run_stats)
+        dead_sources = {url for url, result in probes.items() if result.dead}
+        run_stats.count("sources.dead", len(dead_sources))
+        run_stats.count("sources.unknown", sum(not r.known for r in probes.values()))
+
+        # 新歌曲写入目录并排在最前面，强制模式下同键的现有歌曲被替换
+        valid_songs: list[Song] = []
+        dead_keys: set[tuple[str, str]] = set()
         for song in all_songs:
             # 确保新添加的歌曲有 src
             if not song.src:
                 print(f"跳过没有音频源的新歌曲: {song.title} (ID: {song.id})")
-                skipped_count += 1
-                continue
-
-            # 如果是强制模式，或者歌曲ID不在现有歌曲中，添加到合并列表
-            song_dict = song.model_dump(by_alias=True)
-            combined_songs.append(song_dict)
-
-            # 如果是强制模式且歌曲已存在，从现有歌曲字典中删除，后面不会再添加
-            if force and song.id in existing_song_dict:
-                del existing_song_dict[song.id]
-                replaced_count += 1
-
-        # 添加剩余的现有歌曲（如果不是强制模式，所有现有歌曲都会保留）
-        for song in existing_song_dict.values():
-            combined_songs.append(song)
-
-        # 保存到文件
-        os.makedirs(os.path.dirname(TARGET_PATH), exist_ok=True)
-        async with aiofiles.open(TARGET_PATH, "w", encoding="utf-8") as f:
-            await f.write(json.dumps(combined_songs, ensure_ascii=False, indent=2))
+            elif song.src in dead_sources:
+                print(f"跳过音频源失效的新歌曲: {song.title} (ID: {song.id})")
+                dead_keys.add((song.source, song.id))
+            else:
+                if song.src in metas:
+                    meta = metas[song.src]
+                    song.duration, song.bitrate, song.size = (
+                        meta.duration,
+                        meta.bitrate,
+                        meta.size,
+                    )
+                valid_songs.append(song)
+        skipped_count = len(all_songs) - len(valid_songs)
+        new_songs = SONG_LIST.dump_python(valid_songs, by_alias=True)
+        # 构建时预解析歌词，客户端不再需要解析 LRC
+        for song_dict in new_songs:
+            attach_timeline(song_dict)
+        replaced_count = sum(
+            (song["source"], song["id"]) in existing_keys for song in new_songs
+        )
+        store.upsert(new_songs)
+        # 音频源失效的现有歌曲从目录中移除
+        removed_keys = store.remove_by_src(dead_sources)
+        dead_keys.update(removed_keys)
+        dead_count = len(removed_keys)
+        if dead_count > 0:
+            print(f"移除 {dead_count} 首音频源失效的歌曲")
+        meta_count = store.update_by_src(
+            {url: asdict(meta) for url, meta in metas.items()}
+        )
+        if meta_count > 0:
+            print(f"更新了 {meta_count} 首歌曲的音频元数据")
+
+        # 切换输出格式（盐值变化会清空清单中的记录）或文件被外部修改时也需要重写
+        if (
+            all_songs
+            or unreferenced_count > 0
+            or dead_count > 0
+            or meta_count > 0
+            or refreshed_count > 0
+            or not manifest.catalog_unchanged(TARGET_PATH)
+        ):
+            # 从目录流式导出并原子写入文件，写入成功后日志就不再需要了
+            await write_json_atomic(
+                TARGET_PATH, store.iter_songs(), indent=None if compact else 2
+            )
 
-        if force and replaced_count > 0:
-            print(f"强制模式：替换了 {replaced_count} 首现有歌曲")
+            if force and replaced_count > 0:
+                print(f"强制模式：替换了 {replaced_count} 首现有歌曲")
 
-        print(
-            f"共下载 {len(all_songs) - skipped_count} 首新歌曲（跳过 {skipped_count} 首无效歌曲），总共保存 {len(combined_songs)} 首歌曲"
-        )
-    else:
-        print("没有下载任何新歌曲")
+            saved_count = store.count()
+            run_stats.count("songs.saved", saved_count)
+            print(
+                f"共下载 {len(new_songs)} 首新歌曲（跳过 {skipped_count} 首无效歌曲），总共保存 {saved_count} 首歌曲"
+            )
+        else:
+            print("没有下载任何新歌曲")
+        if sharded:
+            written = await write_sharded_catalog(store.iter_songs())
+            print(f"分片格式已输出到 {SHARDED_PATH}，更新了 {written} 个文件")
+        # 已下架的歌曲，以及地址不会过期、重新获取也是同一个失效地址的歌曲，
+        # 在等待期内记为不可用；会过期的地址（例如QQ音乐）下次运行重新解析
+        retry_at = time.time() + UNAVAILABLE_TTL
+        for key in delisted_songs | dead_keys:
+            if not source_capabilities(key[0]).urls_expire:
+                unavailable[key] = retry_at
+        stored_keys = store.keys()
+        unavailable = {
+            key: retry_at
+            for key, retry_at in unavailable.items()
+            if key in planned_keys and key not in stored_keys
+        }
+        if unavailable:
+            print(f"有 {len(unavailable)} 首歌曲暂时不可用，{UNAVAILABLE_TTL // 86400} 天内不再请求")
+        run_stats.count("songs.unavailable", len(unavailable))
+        manifest.set_unavailable(unavailable)
+        # 获取失败或被移除的歌曲记入清单，下次运行不会走无需处理的快速路径
+        pending_keys = planned_keys - stored_keys - unavailable.keys()
+        if pending_keys:
+            print(f"有 {len(pending_keys)} 首歌曲尚未获取，下次运行时重试")
+        run_stats.count("songs.unresolved", len(pending_keys))
+        manifest.set_pending(pending_keys)
+        store.commit()
+    journal.remove()
+    manifest.mark_catalog(TARGET_PATH)
+    await manifest.save()
 
     elapsed_time = time.time() - start_time
     print(f"下载完成，耗时 {elapsed_time:.2f} 秒")
@@ -488,6 +1121,12 @@ async def main():
     # 检测命令行参数
     force = False
     new_playlist = False
+    resume = False
+    sharded = False
+    compact = False
+    verify = True
+    refresh = False
+    refresh_budget = REFRESH_BUDGET
 
     for arg in os.sys.argv[1:]:
         if arg == "-f" or arg == "--force":
@@ -496,8 +1135,45 @@ async def main():
         elif arg == "-n" or arg == "--new":
             new_playlist = True
             print("创建全新歌单（不保留现有歌曲）")
-
-    await download(force=force, new_playlist=new_playlist)
+        elif arg == "-r" or arg == "--resume":
+            resume = True
+            print("从上次中断的位置继续")
+        elif arg == "-s" or arg == "--sharded":
+            sharded = True
+            print("同时输出分片格式")
+        elif arg == "-c" or arg == "--compact":
+            compact = True
+            print("输出紧凑格式（不缩进）")
+        elif arg == "--no-verify":
+            verify = False
+            print("跳过音频源探测")
+        elif arg == "--refresh":
+            refresh = True
+            print("刷新即将过期的音频地址")
+        elif arg.startswith("--refresh-budget="):
+            value = arg.split("=", 1)[1].strip()
+            if not value.isdigit():
+                print(f"无效的刷新预算: {value!r}，用法: --refresh-budget=<非负整数>")
+                os.sys.exit(2)
+            refresh = True
+            refresh_budget = int(value)
+            print(f"刷新即将过期的音频地址，最多 {refresh_budget} 个请求")
+
+    run_stats.name = "playlist_dump"
+    try:
+        await download(
+            force=force,
+            new_playlist=new_playlist,
+            resume=resume,
+            sharded=sharded,
+            compact=compact,
+            verify=verify,
+            refresh=refresh,
+            refresh_budget=refresh_budget,
+        )
+    finally:
+        await run_stats.write_report(REPORT_PATH)
+        print(run_stats.summary())
 
 
 if __name__ == "__main__":
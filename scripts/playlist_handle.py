@@ -1,18 +1,34 @@
 import asyncio
 import base64
 from dataclasses import dataclass
+from contextlib import aclosing
+from functools import partial
 from typing import Literal
 from urllib.parse import unquote, quote
 import aiofiles
+import hashlib
 import os
 import httpx
 from pydantic import BaseModel
-import json
 import time
 
+import json_codec
+from playlist_audio_meta import AudioMetaCache, read_audio_metas
+from playlist_http import RateLimiter, create_client, map_unordered
+from playlist_http_cache import HttpCache
+from playlist_io import write_text_atomic
+from playlist_lrc import LyricTimeline, parse_lrc
+from playlist_lyric_cache import PURE_MUSIC_LRC, LyricCache
+from playlist_mirrors import ncm_pool
+from playlist_probe import ProbeCache, verify_sources
+from playlist_stats import run_stats
+
 
 SOURCES_PATH = "./data/playlists"
 TARGET_PATH = "./data/musics.json"
+REPORT_PATH = "./.cache/reports/playlist_handle.json"
+# 同时解析的歌曲数，实际请求速率还受 playlist_http 中按主机的令牌桶限制
+RESOLVE_WORKERS = 16
 
 class ResolvedSong(BaseModel):
     title: str
@@ -30,69 +46,187 @@ class ResolvedSong(BaseModel):
     quality: str = ""
     audio: str = ""
     id: str = ""
+    timeline: LyricTimeline | None = None
+    duration: float | None = None
+    bitrate: int | None = None
+    size: int | None = None
 
-async def fetch_lyric_from_ncm(song: ResolvedSong, max_retries: int = 5, base_delay: float = 0.5) -> str:
-    url = f"https://music.163.com/api/song/media?id={song.id}"
+async def fetch_lyric_from_ncm(client: httpx.AsyncClient, song: ResolvedSong, max_retries: int = 5, base_delay: float = 0.5, lyric_cache: LyricCache | None = None) -> str:
+    if lyric_cache is not None:
+        return await lyric_cache.get_or_fetch("ncm", song.id, partial(fetch_lyric_from_ncm, client, song, max_retries, base_delay))
+    path = f"/api/song/media?id={song.id}"
     for attempt in range(max_retries):
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url)
-                if response.status_code == 200:
-                    data = response.json()
-                    lyric = data.get("lyric", "")
-                    nolyric = data.get("nolyric", False)
-                    if nolyric:
-                        lyric = "[00:00.00]music.pure"
-                    if lyric or nolyric:
-                        return lyric
-                # 状态码异常或没有歌词且 nolyric 不为 True 时重试
-            except Exception:
-                pass
+        if attempt:
+            run_stats.record_retry(ncm_pool.host)
+        try:
+            # 请求发往当前最快的健康镜像，失败时在本次尝试内切换到其他镜像
+            response = await ncm_pool.get(client, path)
+            if response.status_code == 200:
+                data = response.json()
+                lyric = data.get("lyric", "")
+                nolyric = data.get("nolyric", False)
+                if nolyric:
+                    lyric = PURE_MUSIC_LRC
+                if lyric or nolyric:
+                    return lyric
+            # 状态码异常或没有歌词且 nolyric 不为 True 时重试
+        except Exception:
+            pass
         await asyncio.sleep(base_delay * (2 ** attempt))
     return ""
 
 
 async def main():
-    existing_data: list[ResolvedSong] = []
+    run_stats.name = "playlist_handle"
+    try:
+        with (
+            LyricCache() as lyric_cache,
+            HttpCache() as http_cache,
+            ProbeCache() as probe_cache,
+            AudioMetaCache() as meta_cache,
+        ):
+            async with create_client(
+                limiter=RateLimiter(), stats=run_stats, cache=http_cache
+            ) as client:
+                await resolve_all(client, lyric_cache, probe_cache, meta_cache)
+            lyric_cache.record_stats(run_stats)
+            run_stats.record_cache("probe", probe_cache.hits, probe_cache.misses)
+            run_stats.record_cache("audio_meta", meta_cache.hits, meta_cache.misses)
+            http_cache.record_stats(run_stats)
+    finally:
+        await run_stats.write_report(REPORT_PATH)
+        print(run_stats.summary())
+
+
+def build_song(track: dict) -> ResolvedSong:
+    """把歌单中的网易云歌曲转换为 ResolvedSong，音频地址按 CDN 上的命名规则拼出"""
+    song = ResolvedSong(
+        title=track.get("name", ""),
+        artist=",".join(artist["name"] for artist in track.get("ar", [])),
+        album=track.get("al", {}).get("name", ""),
+        alias=track.get("alia", []),
+        cover=track.get("al", {}).get("picUrl", ""),
+        songLink=f"https://music.163.com/#/song?id={track.get('id', '')}",
+        source="ncm",
+        audio=track.get("audio", ""),
+        id=str(track.get("id", ""))
+    )
+    song.src = f"https://cdn.liteyuki.org/snowykami/music/{quote(song.artist)}%20-%20{quote(song.title)}.mp3"
+    return song
+
+
+async def resolve_track(
+    client: httpx.AsyncClient,
+    track: dict,
+    existing_by_id: dict[str, ResolvedSong],
+    lyric_cache: LyricCache,
+) -> tuple[ResolvedSong, bool]:
+    """解析单首歌曲，已存在的歌曲直接复用，返回 (歌曲, 是否来自现有数据)"""
+    cached = existing_by_id.get(str(track.get("id", "")))
+    if cached is not None:
+        song = cached
+    else:
+        song = build_song(track)
+        song.lrc = await fetch_lyric_from_ncm(client, song, lyric_cache=lyric_cache)
+    if song.timeline is None and song.lrc:
+        song.timeline = parse_lrc(song.lrc, song.offset)
+    return song, cached is not None
+
+
+async def resolve_playlist(
+    client: httpx.AsyncClient,
+    tracks: list[dict],
+    existing_by_id: dict[str, ResolvedSong],
+    lyric_cache: LyricCache,
+    workers: int = RESOLVE_WORKERS,
+) -> list[ResolvedSong]:
+    """以有限并发解析一个歌单中的所有歌曲，结果保持歌单中的顺序
+
+    Args:
+        client: 共享的连接池客户端
+        tracks: 歌单中的歌曲
+        existing_by_id: 现有歌曲按 ID 建立的索引
+        lyric_cache: 歌词缓存
+        workers: 最大并发数
+    """
+    slots: list[ResolvedSong | None] = [None] * len(tracks)
+    count = 0
+    async with aclosing(
+        map_unordered(
+            list(enumerate(tracks)),
+            lambda item: resolve_track(client, item[1], existing_by_id, lyric_cache),
+            workers,
+        )
+    ) as results:
+        async for (index, track), result in results:
+            if isinstance(result, BaseException):
+                print(f"Error resolving song {track.get('id', '')}: {result}")
+                continue
+            song, cached = result
+            slots[index] = song
+            run_stats.count("songs.cached" if cached else "songs.added")
+            count += 1
+            print(f"Resolved: {count} - {"cached" if cached else "added"} - {song.title}")
+    return [song for song in slots if song is not None]
+
+
+async def resolve_all(
+    client: httpx.AsyncClient,
+    lyric_cache: LyricCache,
+    probe_cache: ProbeCache,
+    meta_cache: AudioMetaCache,
+):
     async with aiofiles.open(TARGET_PATH, 'r', encoding='utf-8') as f:
         content = await f.read()
-        existing_data = [ResolvedSong(**i) for i in json.loads(content)]
-        existing_ids = [song.id for song in existing_data]
+        existing_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        # 按 ID 建立索引，重复的 ID 以第一次出现的为准
+        existing_by_id: dict[str, ResolvedSong] = {}
+        for item in json_codec.loads(content):
+            song = ResolvedSong(**item)
+            existing_by_id.setdefault(song.id, song)
 
-    for file in os.listdir(SOURCES_PATH):
+    # 所有歌单文件按文件名顺序合并，同一首歌只保留第一次出现的位置
+    tracks_by_id: dict[str, dict] = {}
+    for file in sorted(os.listdir(SOURCES_PATH)):
         if file.endswith(".json"):
             async with aiofiles.open(os.path.join(SOURCES_PATH, file), 'r', encoding='utf-8') as f:
-                content = await f.read()
-                json_data = json.loads(content)
-                resolved_songs: list[ResolvedSong] = []
-                count = 0
-                for song in json_data["playlist"]["tracks"]:
-                    try:
-                        cached = False
-                        if str(song.get("id", "")) in existing_ids:
-                            cached = True
-                            resolved_song = existing_data[existing_ids.index(str(song.get("id", "")))]
-                        else:
-                            resolved_song = ResolvedSong(
-                                title=song.get("name", ""),
-                                artist=",".join(artist["name"] for artist in song.get("ar", [])),
-                                album=song.get("al", {}).get("name", ""),
-                                alias=song.get("alia", []),
-                                cover=song.get("al", {}).get("picUrl", ""),
-                                songLink=f"https://music.163.com/#/song?id={song.get('id', '')}",
-                                source="ncm",
-                                audio=song.get("audio", ""),
-                                id=str(song.get("id", ""))
-                            )
-                            resolved_song.src = f"https://cdn.liteyuki.org/snowykami/music/{quote(resolved_song.artist)}%20-%20{quote(resolved_song.title)}.mp3"
-                            resolved_song.lrc = await fetch_lyric_from_ncm(resolved_song)
-                        resolved_songs.append(resolved_song)
-                        count += 1
-                        print(f"Resolved: {count} - {"cached" if cached else "added"} - {resolved_song.title}")
-                    except Exception as e:
-                        print(f"Error resolving song {song.get('id', '')}: {e}")
-                async with aiofiles.open(TARGET_PATH, 'w', encoding='utf-8') as f:
-                    await f.write(json.dumps([song.model_dump() for song in resolved_songs], ensure_ascii=False, indent=4))
+                json_data = json_codec.loads(await f.read())
+            for track in json_data["playlist"]["tracks"]:
+                tracks_by_id.setdefault(str(track.get("id", "")), track)
+
+    resolved_songs = await resolve_playlist(
+        client, list(tracks_by_id.values()), existing_by_id, lyric_cache
+    )
+
+    # 拼出来的 CDN 地址不一定存在，写出前并发探测，去掉失效的歌曲
+    probes = await verify_sources(
+        client, [song.src for song in resolved_songs], probe_cache
+    )
+    alive_songs = []
+    for song in resolved_songs:
+        result = probes[song.src]
+        if result.dead:
+            print(f"Dead source ({result.status}): {song.title} - {song.src}")
+            run_stats.count("sources.dead")
+        else:
+            alive_songs.append(song)
+    resolved_songs = alive_songs
+    # 只读取文件头解析时长、比特率和大小，文件没变化时直接使用缓存
+    metas = await read_audio_metas(client, probes, meta_cache)
+    for song in resolved_songs:
+        if song.src in metas:
+            meta = metas[song.src]
+            song.duration, song.bitrate, song.size = meta.duration, meta.bitrate, meta.size
+
+    # 只序列化一次，内容没有变化时不重写文件
+    output = json_codec.dumps([song.model_dump() for song in resolved_songs], indent=4)
+    if hashlib.sha256(output.encode("utf-8")).hexdigest() == existing_hash:
+        print(f"{TARGET_PATH} 内容没有变化，跳过写入")
+        return
+    await write_text_atomic(TARGET_PATH, output)
+    run_stats.count("songs.saved", len(resolved_songs))
+    print(f"Saved {len(resolved_songs)} songs to {TARGET_PATH}")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,384 @@
+import asyncio
+import importlib.util
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from playlist_http_cache import CachingTransport, HttpCache
+from playlist_stats import InstrumentedTransport, RunStats
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.110 Safari/537.36"
+
+# 连接池配置，httpx 会按 (scheme, host, port) 复用连接
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30.0
+# 是否启用 HTTP/2，需要安装 h2，未安装时自动回退到 HTTP/1.1
+HTTP2 = True
+DEFAULT_TIMEOUT = 10.0
+# 替换真实网络的底层传输，例如基准测试中的模拟上游，None 表示使用真实网络
+base_transport: httpx.AsyncBaseTransport | None = None
+
+
+@dataclass
+class HostLimit:
+    """单个上游主机的限流配置
+
+    Attributes:
+        rate: 初始每秒请求数
+        burst: 令牌桶容量，允许的突发请求数
+        max_in_flight: 同时进行中的最大请求数
+        min_rate: 上游限流时降速的下限
+        max_rate: 上游健康时提速的上限
+        increase: 每个成功响应增加的速率（请求/秒）
+        decrease: 遇到 429/5xx 时速率乘以的系数
+    """
+
+    rate: float = 5.0
+    burst: int = 5
+    max_in_flight: int = 5
+    min_rate: float = 0.5
+    max_rate: float = 50.0
+    increase: float = 0.1
+    decrease: float = 0.5
+
+
+# 按主机配置限流，未列出的主机使用 DEFAULT_HOST_LIMIT
+# 网易云镜像池（playlist_mirrors.ncm_pool）的主机 playlist_dump 和 playlist_handle 都会用到，配置在这里；
+# 只被 playlist_dump 中某个来源使用的主机由 playlist_sources 中的来源适配器声明
+HOST_LIMITS: dict[str, HostLimit] = {
+    "ncm.api.liteyuki.org": HostLimit(rate=10.0, burst=10, max_in_flight=8),
+    "music.163.com": HostLimit(rate=5.0, burst=5, max_in_flight=5, max_rate=20.0),
+}
+DEFAULT_HOST_LIMIT = HostLimit()
+
+
+def is_throttled(status_code: int) -> bool:
+    """判断响应是否意味着上游过载"""
+    return status_code == 429 or status_code >= 500
+
+
+class TokenBucket:
+    """带并发上限的自适应令牌桶（AIMD）
+
+    成功响应时线性提速，429/5xx 或连接错误时按比例降速，
+    并遵守 Retry-After 暂停发送。
+    """
+
+    def __init__(self, limit: HostLimit):
+        self.limit = limit
+        self.rate = limit.rate
+        self.tokens = float(limit.burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._in_flight = asyncio.Semaphore(limit.max_in_flight)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            float(self.limit.burst), self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        """等待一个并发名额和一个令牌"""
+        await self._in_flight.acquire()
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    if now < self.paused_until:
+                        await asyncio.sleep(self.paused_until - now)
+                        continue
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+    def release(self) -> None:
+        self._in_flight.release()
+
+    def on_success(self) -> None:
+        self.rate = min(self.limit.max_rate, self.rate + self.limit.increase)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.limit.min_rate, self.rate * self.limit.decrease)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+
+class RateLimiter:
+    """按上游主机分配令牌桶，整次运行共享"""
+
+    def __init__(
+        self,
+        limits: dict[str, HostLimit] | None = None,
+        default: HostLimit = DEFAULT_HOST_LIMIT,
+    ):
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.default = default
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.limits.get(host, self.default))
+        return self.buckets[host]
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """在真正发送请求前经过对应主机的令牌桶，并根据响应状态调整速率"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        bucket = self.limiter.bucket(request.url.host)
+        await bucket.acquire()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            bucket.on_throttle()
+            raise
+        finally:
+            bucket.release()
+        if is_throttled(response.status_code):
+            bucket.on_throttle(_parse_retry_after(response.headers.get("Retry-After")))
+        else:
+            bucket.on_success()
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def http2_available() -> bool:
+    """检查是否安装了 HTTP/2 所需的 h2 依赖"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_client(
+    timeout: float = DEFAULT_TIMEOUT,
+    http2: bool = HTTP2,
+    max_connections: int = MAX_CONNECTIONS,
+    max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = KEEPALIVE_EXPIRY,
+    limiter: RateLimiter | None = None,
+    stats: RunStats | None = None,
+    cache: HttpCache | None = None,
+) -> httpx.AsyncClient:
+    """创建一个在整次运行中复用的连接池客户端
+
+    同一个客户端应当贯穿所有请求，避免每首歌都重新进行 TCP+TLS 握手。
+    调用方负责在运行结束时关闭客户端（推荐使用 async with）。
+
+    Args:
+        timeout: 默认请求超时（秒），单个请求可以通过 timeout 参数覆盖
+        http2: 是否启用 HTTP/2，未安装 h2 时忽略
+        max_connections: 连接池最大连接数
+        max_keepalive_connections: 最大保持活动的空闲连接数
+        keepalive_expiry: 空闲连接保持时间（秒）
+        limiter: 按主机限流的令牌桶，所有经过该客户端的请求都会被限流
+        stats: 记录每个请求的主机、状态码、延迟和字节数
+        cache: HTTP 响应缓存，新鲜的响应不经过限流也不发出请求
+    """
+    transport: httpx.AsyncBaseTransport = base_transport or httpx.AsyncHTTPTransport(
+        http2=http2 and http2_available(),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    # 统计在限流之内，记录的延迟不包含排队等待令牌的时间
+    if stats is not None:
+        transport = InstrumentedTransport(transport, stats)
+    if limiter is not None:
+        transport = RateLimitedTransport(transport, limiter)
+    if cache is not None:
+        transport = CachingTransport(transport, cache)
+    return httpx.AsyncClient(
+        timeout=timeout,
+        transport=transport,
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+class LatencyTracker:
+    """记录最近若干次请求的耗时，用于计算对冲请求的触发阈值
+
+    Args:
+        window: 保留的样本数
+        percentile: 触发对冲的延迟分位数
+        default: 样本不足时使用的阈值（秒）
+        min_samples: 开始使用统计值所需的最少样本数
+    """
+
+    def __init__(
+        self,
+        window: int = 200,
+        percentile: float = 0.95,
+        default: float = 1.0,
+        min_samples: int = 20,
+    ):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.percentile = percentile
+        self.default = default
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if len(self.samples) < self.min_samples:
+            return self.default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def threshold(self) -> float:
+        return self.quantile(self.percentile)
+
+
+async def hedge[T](
+    attempts: list[Callable[[], Awaitable[T | None]]], delays: list[float]
+) -> T | None:
+    """对冲请求：先发出第一个请求，超过对应延迟仍未完成或失败时再发出下一个，
+    取第一个有效结果并取消其余请求
+
+    Args:
+        attempts: 候选请求，按优先级排列，返回假值或抛出异常都视为失败
+        delays: 每个候选请求发出后，等待多久再发出下一个候选请求（秒）
+
+    Returns:
+        第一个有效结果，全部失败时返回 None
+    """
+    tasks: set[asyncio.Task] = set()
+    launched = 0
+
+    def launch() -> None:
+        nonlocal launched
+        tasks.add(asyncio.create_task(attempts[launched]()))
+        launched += 1
+
+    if not attempts:
+        return None
+    launch()
+    try:
+        while tasks:
+            timeout = delays[launched - 1] if launched < len(attempts) else None
+            done, _ = await asyncio.wait(
+                tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None and task.result():
+                    return task.result()
+            # 超时或者有候选请求失败，立即发出下一个
+            if launched < len(attempts):
+                launch()
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def map_unordered[K, T](
+    items: list[K], fn: Callable[[K], Awaitable[T]], limit: int
+) -> AsyncIterator[tuple[K, T | Exception]]:
+    """用固定数量的 worker 并发处理 items，按完成顺序产出 (item, 结果或异常)
+
+    生成器关闭（例如提前 break 或外部取消）时会取消所有未完成的 worker，
+    调用方应配合 contextlib.aclosing 使用。
+
+    Args:
+        items: 待处理的元素
+        fn: 处理单个元素的协程函数
+        limit: 最大并发数
+    """
+    pending = iter(items)
+    results: asyncio.Queue[tuple[K, T | Exception]] = asyncio.Queue()
+
+    async def worker() -> None:
+        for item in pending:
+            try:
+                results.put_nowait((item, await fn(item)))
+            except Exception as e:
+                results.put_nowait((item, e))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(limit, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class SingleFlight[K, T]:
+    """进程内的请求合并：同一个键同时只有一个请求在进行，并发的调用方共享它的结果
+
+    请求完成后立即从表中移除，结果本身的缓存由调用方负责（例如 LyricCache）。
+
+    Attributes:
+        leaders: 实际发出请求的次数
+        coalesced: 加入进行中的请求、没有再发出请求的次数
+    """
+
+    def __init__(self):
+        self.flights: dict[K, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: K, fetch: Callable[[], Awaitable[T]]) -> T:
+        """获取 key 对应的结果，已有相同 key 的请求在进行时等待它完成
+
+        Args:
+            key: 请求的键
+            fetch: 没有进行中的请求时，实际发出请求的协程工厂
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = self.flights[key] = _Flight(asyncio.ensure_future(fetch()))
+            flight.task.add_done_callback(
+                lambda _: self.flights.pop(key, None) if self.flights.get(key) is flight else None
+            )
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # 单个调用方被取消不会取消其他调用方共享的请求
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            # 所有调用方都已放弃时才取消请求，先移出表，之后到来的调用方会发出新请求
+            if flight.waiters == 0 and not flight.task.done():
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
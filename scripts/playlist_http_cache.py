@@ -0,0 +1,253 @@
+import hashlib
+import time
+
+import httpx
+
+import json_codec
+from playlist_sqlite import SqliteStore
+from playlist_stats import RunStats
+
+HTTP_CACHE_PATH = "./.cache/http.sqlite3"
+# 上游没有给出 Cache-Control 时，各主机的响应在多长时间内（秒）直接使用缓存
+# QQ 的 get_url 返回带时效的音频地址，只做条件请求/内容比对，不直接复用
+CACHE_FRESHNESS = {
+    "ncm.api.liteyuki.org": 24 * 3600,
+    "music.163.com": 24 * 3600,
+    "music.api.liteyuki.org": 0,
+}
+DEFAULT_FRESHNESS = 0.0
+# 不经过 HTTP 缓存的接口路径（后缀匹配）：歌词由 LyricCache 缓存，并且有按内容区分的负缓存
+UNCACHED_PATHS = ("/song/media",)
+# 超过这个时间没有再被请求的条目会被清理
+MAX_STALE = 30 * 24 * 3600
+# 不随缓存响应一起保存的头部，正文保存的是解码后的内容
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+# 标记由本地缓存返回的响应的扩展字段；不用头部，上游自己的 X-Cache 等头部会原样保存在缓存里
+FROM_CACHE = "playlist.from_cache"
+
+
+def _has_payload(url: httpx.URL, body: bytes) -> bool:
+    """响应是否包含完整的有效数据，不完整的响应不缓存
+
+    - JSON 接口在 HTTP 200 中用 code 字段表示业务错误（例如网易云的 -460）
+    - 批量详情接口（ids=[...]）返回的 songs 少于请求的ID数时，缺失的歌曲需要重试
+    """
+    if not body.lstrip().startswith(b"{"):
+        return True
+    try:
+        data = json_codec.loads(body)
+    except ValueError:
+        return True
+    if not isinstance(data, dict):
+        return True
+    if data.get("code", 200) != 200:
+        return False
+    ids = url.params.get("ids")
+    if ids is not None and "songs" in data:
+        requested = [i for i in ids.strip("[]").split(",") if i.strip()]
+        return len(data["songs"] or []) >= len(requested)
+    return True
+
+
+def from_cache(response: httpx.Response) -> bool:
+    """响应是否由本地 HTTP 缓存返回（新鲜命中或 304 重新验证）"""
+    return bool(response.extensions.get(FROM_CACHE))
+
+
+def _max_age(headers: httpx.Headers) -> float | None:
+    """解析 Cache-Control，no-store 返回 -1，没有 max-age 时返回 None"""
+    directives = [d.strip().lower() for d in headers.get("cache-control", "").split(",")]
+    if "no-store" in directives:
+        return -1
+    if "no-cache" in directives:
+        return 0
+    for directive in directives:
+        if directive.startswith("max-age="):
+            try:
+                return max(0, int(directive[len("max-age=") :]))
+            except ValueError:
+                return None
+    return None
+
+
+class HttpCache(SqliteStore):
+    """基于 SQLite 的 HTTP 响应缓存，以 URL 为键
+
+    保存响应正文、ETag/Last-Modified 验证器和正文哈希。新鲜期内直接返回缓存，
+    过期后有验证器时发送条件请求，没有验证器时重新请求并比较正文哈希。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            headers TEXT NOT NULL,
+            body BLOB NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            sha256 TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+    """
+
+    def __init__(
+        self,
+        path: str = HTTP_CACHE_PATH,
+        freshness: dict[str, float] | None = None,
+        default_freshness: float = DEFAULT_FRESHNESS,
+    ):
+        super().__init__(path)
+        self.freshness = CACHE_FRESHNESS if freshness is None else freshness
+        self.default_freshness = default_freshness
+        self.hits = 0
+        self.revalidated = 0
+        self.unchanged = 0
+        self.misses = 0
+
+    def get(self, url: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT headers, body, etag, last_modified, sha256, expires_at FROM responses WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        headers, body, etag, last_modified, sha256, expires_at = row
+        return {
+            "headers": json_codec.loads(headers),
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": sha256,
+            "expires_at": expires_at,
+        }
+
+    def expires_at(self, url: httpx.URL, headers: httpx.Headers) -> float | None:
+        """计算响应的过期时间，不应缓存时返回 None"""
+        max_age = _max_age(headers)
+        if max_age is None:
+            max_age = self.freshness.get(url.host, self.default_freshness)
+        if max_age < 0:
+            return None
+        return time.time() + max_age
+
+    def set(self, url: str, headers: httpx.Headers, body: bytes, expires_at: float) -> None:
+        kept = [(k, v) for k, v in headers.multi_items() if k.lower() not in DROPPED_HEADERS]
+        self.write(
+            "INSERT OR REPLACE INTO responses "
+            "(url, headers, body, etag, last_modified, sha256, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                url,
+                json_codec.dumps(kept),
+                body,
+                headers.get("etag"),
+                headers.get("last-modified"),
+                hashlib.sha256(body).hexdigest(),
+                expires_at,
+                time.time(),
+            ),
+        )
+
+    def touch(self, url: str, expires_at: float) -> None:
+        """重新验证通过后延长条目的有效期"""
+        self.write(
+            "UPDATE responses SET expires_at = ?, accessed_at = ? WHERE url = ?",
+            (expires_at, time.time(), url),
+        )
+
+    def prune(self) -> int:
+        """清理长时间没有被请求的条目，返回删除数量"""
+        return self.write(
+            "DELETE FROM responses WHERE accessed_at < ?", (time.time() - MAX_STALE,)
+        )
+
+    def record_stats(self, stats: RunStats) -> None:
+        """写入运行报告，304 重新验证计为命中，内容比对一致的仍然传输了正文，计为未命中"""
+        stats.record_cache("http", self.hits, self.misses + self.unchanged)
+        stats.count("http_cache.revalidated", self.revalidated)
+        stats.count("http_cache.unchanged", self.unchanged)
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """为 GET 请求提供 HTTP 缓存，只缓存 200 且数据完整的响应（见 _has_payload）
+
+    - 新鲜期内：不发出请求，直接返回缓存（hits）
+    - 有 ETag/Last-Modified：发送 If-None-Match/If-Modified-Since，304 时返回缓存（revalidated，也计为命中）
+    - 没有验证器：重新请求，正文哈希与缓存一致时只延长有效期（unchanged）
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cache: HttpCache):
+        self.transport = transport
+        self.cache = cache
+
+    def _cached_response(self, request: httpx.Request, entry: dict) -> httpx.Response:
+        return httpx.Response(
+            status_code=200,
+            headers=entry["headers"],
+            content=entry["body"],
+            request=request,
+            extensions={FROM_CACHE: True},
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # 探测音频源的 Range 请求不缓存，避免服务器忽略 Range 时把整个文件读进缓存
+        if (
+            request.method != "GET"
+            or "range" in request.headers
+            or request.url.path.endswith(UNCACHED_PATHS)
+        ):
+            return await self.transport.handle_async_request(request)
+
+        url = str(request.url)
+        entry = self.cache.get(url)
+        if entry is not None and entry["expires_at"] > time.time():
+            self.cache.hits += 1
+            self.cache.touch(url, entry["expires_at"])
+            return self._cached_response(request, entry)
+
+        if entry is not None:
+            if entry["etag"]:
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = await self.transport.handle_async_request(request)
+        if entry is not None and response.status_code == 304:
+            await response.aclose()
+            self.cache.hits += 1
+            self.cache.revalidated += 1
+            expires_at = self.cache.expires_at(request.url, response.headers)
+            self.cache.touch(url, expires_at or time.time())
+            return self._cached_response(request, entry)
+
+        if response.status_code != 200:
+            if entry is None:
+                self.cache.misses += 1
+            return response
+
+        body = await response.aread()
+        expires_at = self.cache.expires_at(request.url, response.headers)
+        digest = hashlib.sha256(body).hexdigest()
+        if entry is not None and entry["sha256"] == digest:
+            self.cache.unchanged += 1
+            self.cache.touch(url, expires_at or time.time())
+        else:
+            self.cache.misses += 1
+            # 没有有效数据的响应不缓存，调用方的重试才能真正到达上游
+            if expires_at is not None and _has_payload(request.url, body):
+                self.cache.set(url, response.headers, body, expires_at)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=[
+                (k, v)
+                for k, v in response.headers.multi_items()
+                if k.lower() not in DROPPED_HEADERS
+            ],
+            content=body,
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
@@ -0,0 +1,132 @@
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any
+
+import aiofiles
+
+import json_codec
+
+JOURNAL_PATH = "./.cache/playlist_dump.journal.ndjson"
+
+
+@asynccontextmanager
+async def open_atomic(path: str):
+    """以原子方式写入文件：先写到同目录的临时文件，成功后再 rename 覆盖目标文件
+
+    写入过程中崩溃不会留下半个文件，读者要么看到旧内容，要么看到新内容。
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+            yield f
+            await f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def write_text_atomic(path: str, content: str) -> None:
+    """原子写入文本文件"""
+    async with open_atomic(path) as f:
+        await f.write(content)
+
+
+async def write_json_atomic(
+    path: str, obj: Any, indent: int | None = None, buffer_size: int = 1 << 16
+) -> None:
+    """流式编码 JSON 并原子写入，顶层列表或迭代器逐个元素编码，不会在内存中拼出完整字符串
+
+    Args:
+        path: 目标文件路径
+        obj: 要写入的对象，传入迭代器时按数组输出
+        indent: 缩进宽度，None 表示紧凑格式
+        buffer_size: 攒够多少字符写一次文件
+    """
+    async with open_atomic(path) as f:
+        buffer: list[str] = []
+        size = 0
+        for chunk in json_codec.iterencode(obj, indent):
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                await f.write("".join(buffer))
+                buffer, size = [], 0
+        await f.write("".join(buffer))
+
+
+class DumpJournal:
+    """playlist_dump 的断点续传日志（NDJSON，只追加）
+
+    每完成一批就追加该批解析出的歌曲（"song" 行）和这些歌曲的 (来源, ID)（"chunk" 行），
+    --resume 时回放日志，已完成的歌曲不再请求。
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        self._file = None
+
+    def replay(self) -> tuple[list[dict], set[tuple[str, str]]]:
+        """读取日志，返回已解析的歌曲和已完成歌曲的 (来源, ID)
+
+        只有写完 "chunk" 行的批次才算完成，崩溃时写了一半的批次会被忽略。
+        """
+        songs: list[dict] = []
+        done_keys: set[tuple[str, str]] = set()
+        if not os.path.exists(self.path):
+            return songs, done_keys
+
+        pending: list[dict] = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json_codec.loads(line)
+                except ValueError:
+                    # 最后一行可能在崩溃时只写了一半
+                    break
+                if record.get("type") == "song":
+                    pending.append(record["song"])
+                elif record.get("type") == "chunk":
+                    songs.extend(pending)
+                    pending = []
+                    done_keys.update(tuple(key) for key in record.get("keys", []))
+        return songs, done_keys
+
+    def open(self, resume: bool = False) -> None:
+        """打开日志准备追加，非续传模式会清空旧日志"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def record_chunk(self, keys: list[tuple[str, str]], songs: list[dict]) -> None:
+        """追加一个已完成批次并立即落盘
+
+        Args:
+            keys: 实际获取到的歌曲的 (来源, ID)
+            songs: 这些歌曲导出的字典
+        """
+        if self._file is None:
+            return
+        lines = [json_codec.dumps({"type": "song", "song": song}) for song in songs]
+        lines.append(json_codec.dumps({"type": "chunk", "keys": keys}))
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        """最终结果写入成功后删除日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
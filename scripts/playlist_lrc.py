@@ -0,0 +1,76 @@
+import re
+
+from pydantic import BaseModel
+
+TIME_TAG = re.compile(r"\[(\d+):(\d+)(?:[.:](\d+))?\]")
+META_TAG = re.compile(r"^\[([A-Za-z#]+):(.*)\]$")
+# 表示纯音乐的歌词内容
+PURE_MARKERS = {"music.pure", "pure_music_without_lyric"}
+
+
+class LyricTimeline(BaseModel):
+    """预解析的歌词时间轴
+
+    times 为升序的毫秒时间戳，lines 为对应的歌词行，两者一一对应，
+    播放时用二分查找即可定位当前行。偏移量在构建时已经应用。
+    """
+
+    times: list[int] = []
+    lines: list[str] = []
+    pure: bool = False
+
+
+def _to_ms(minutes: str, seconds: str, fraction: str | None) -> int:
+    ms = int(fraction.ljust(3, "0")[:3]) if fraction else 0
+    return (int(minutes) * 60 + int(seconds)) * 1000 + ms
+
+
+def parse_lrc(lrc: str, offset: int = 0) -> LyricTimeline:
+    """把 LRC 文本解析为时间轴
+
+    - 一行多个时间标签会展开为多条
+    - 相同时间戳的多行（例如翻译）合并为一行，用换行分隔
+    - 元数据标签（[ti:]、[ar:] 等）和没有时间标签的行被丢弃
+    - [offset:] 标签和 offset 参数都会被应用，与 LRC 规范一致，正值让歌词提前显示
+    - 只有纯音乐标记时返回 pure=True 的空时间轴
+
+    Args:
+        lrc: LRC 歌词文本
+        offset: 额外的偏移量（毫秒），对应 Song.offset
+    """
+    entries: list[tuple[int, str]] = []
+    lrc_offset = 0
+    for raw_line in lrc.splitlines():
+        line = raw_line.strip()
+        times = []
+        pos = 0
+        while match := TIME_TAG.match(line, pos):
+            times.append(_to_ms(*match.groups()))
+            pos = match.end()
+        if not times:
+            meta = META_TAG.match(line)
+            if meta and meta.group(1).lower() == "offset":
+                try:
+                    lrc_offset = int(meta.group(2).strip())
+                except ValueError:
+                    pass
+            continue
+        text = line[pos:].strip()
+        entries.extend((time, text) for time in times)
+
+    texts = {text for _, text in entries if text}
+    if texts and texts <= PURE_MARKERS:
+        return LyricTimeline(pure=True)
+
+    shift = offset + lrc_offset
+    merged: dict[int, list[str]] = {}
+    for time, text in entries:
+        lines = merged.setdefault(max(0, time - shift), [])
+        if text and text not in lines:
+            lines.append(text)
+
+    timeline = LyricTimeline()
+    for time in sorted(merged):
+        timeline.times.append(time)
+        timeline.lines.append("\n".join(merged[time]))
+    return timeline
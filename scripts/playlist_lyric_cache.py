@@ -0,0 +1,156 @@
+import time
+from typing import Awaitable, Callable
+
+from playlist_http import SingleFlight
+from playlist_sqlite import SqliteStore
+from playlist_stats import RunStats
+
+LYRIC_CACHE_PATH = "./.cache/lyrics.sqlite3"
+# 歌词几乎不会变化，正常歌词缓存 30 天
+LYRIC_TTL = 30 * 24 * 3600
+# nolyric（纯音乐）可能之后会补上歌词，缓存时间短一些
+NOLYRIC_TTL = 7 * 24 * 3600
+# 缓存总大小上限（按歌词文本字节数计算），超出后按最近访问时间淘汰
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+PURE_MUSIC_LRC = "[00:00.00]music.pure"
+
+
+class LyricCache(SqliteStore):
+    """基于 SQLite 的本地歌词缓存，以 (来源, 歌词ID) 为键
+
+    每个条目有独立的过期时间，nolyric 作为负缓存单独计时，
+    关闭时会清理过期条目并按最近访问时间淘汰超出容量的条目。
+    多首歌共用同一个歌词ID时，并发的未命中只会发出一次请求。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS lyrics (
+            source TEXT NOT NULL,
+            lrcmid TEXT NOT NULL,
+            lyric TEXT NOT NULL,
+            nolyric INTEGER NOT NULL DEFAULT 0,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (source, lrcmid)
+        );
+        CREATE INDEX IF NOT EXISTS idx_lyrics_accessed_at ON lyrics (accessed_at);
+    """
+
+    def __init__(
+        self,
+        path: str = LYRIC_CACHE_PATH,
+        ttl: float = LYRIC_TTL,
+        nolyric_ttl: float = NOLYRIC_TTL,
+        max_bytes: int = MAX_CACHE_BYTES,
+    ):
+        super().__init__(path)
+        self.ttl = ttl
+        self.nolyric_ttl = nolyric_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.flights: SingleFlight[tuple[str, str], str] = SingleFlight()
+
+    def get(self, source: str, lrcmid: str) -> str | None:
+        """读取缓存的歌词，未命中或已过期时返回 None
+
+        Args:
+            source: 歌词来源，例如 "ncm"、"qq"
+            lrcmid: 歌词ID
+        """
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT lyric, nolyric FROM lyrics WHERE source = ? AND lrcmid = ? AND expires_at > ?",
+            (source, lrcmid, now),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.write(
+            "UPDATE lyrics SET accessed_at = ? WHERE source = ? AND lrcmid = ?",
+            (now, source, lrcmid),
+        )
+        self.hits += 1
+        return PURE_MUSIC_LRC if row[1] else row[0]
+
+    def set(
+        self, source: str, lrcmid: str, lyric: str, ttl: float | None = None
+    ) -> None:
+        """写入歌词，空歌词（获取失败）不会被缓存
+
+        Args:
+            source: 歌词来源
+            lrcmid: 歌词ID
+            lyric: 歌词文本，纯音乐标记会被记为 nolyric 负缓存
+            ttl: 覆盖默认的过期时间（秒）
+        """
+        if not lyric:
+            return
+        nolyric = lyric == PURE_MUSIC_LRC
+        if ttl is None:
+            ttl = self.nolyric_ttl if nolyric else self.ttl
+        now = time.time()
+        stored = "" if nolyric else lyric
+        self.write(
+            "INSERT OR REPLACE INTO lyrics (source, lrcmid, lyric, nolyric, size, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                source,
+                lrcmid,
+                stored,
+                int(nolyric),
+                len(stored.encode("utf-8")),
+                now + ttl,
+                now,
+            ),
+        )
+
+    async def get_or_fetch(
+        self, source: str, lrcmid: str, fetch: Callable[[], Awaitable[str]]
+    ) -> str:
+        """先查缓存，未命中时调用 fetch 获取歌词并写回缓存，同一歌词的并发请求会被合并
+
+        Args:
+            source: 歌词来源
+            lrcmid: 歌词ID
+            fetch: 实际获取歌词的协程工厂
+        """
+        lyric = self.get(source, lrcmid)
+        if lyric is not None:
+            return lyric
+        return await self.flights.do(
+            (source, lrcmid), lambda: self._fetch_and_set(source, lrcmid, fetch)
+        )
+
+    async def _fetch_and_set(
+        self, source: str, lrcmid: str, fetch: Callable[[], Awaitable[str]]
+    ) -> str:
+        lyric = await fetch()
+        self.set(source, lrcmid, lyric)
+        return lyric
+
+    def record_stats(self, stats: RunStats) -> None:
+        """写入运行报告，合并到进行中请求的未命中不计为未命中，单独记为 lyric_cache.coalesced"""
+        stats.record_cache("lyric", self.hits, self.flights.leaders)
+        stats.count("lyric_cache.coalesced", self.flights.coalesced)
+
+    def prune(self) -> int:
+        """清理过期条目，并按最近访问时间淘汰超出容量上限的条目，返回删除数量"""
+        removed = self.conn.execute(
+            "DELETE FROM lyrics WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+        removed += self.conn.execute(
+            """
+            DELETE FROM lyrics WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, SUM(size) OVER (ORDER BY accessed_at DESC, rowid DESC) AS total
+                    FROM lyrics
+                ) WHERE total > ?
+            )
+            """,
+            (self.max_bytes,),
+        ).rowcount
+        self.conn.commit()
+        return removed
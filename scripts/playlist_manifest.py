@@ -0,0 +1,136 @@
+import hashlib
+import os
+
+import aiofiles
+
+import json_codec
+from playlist_io import write_json_atomic
+
+MANIFEST_PATH = "./.cache/playlist_manifest.json"
+
+
+def _stat_key(path: str) -> dict:
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+class PlaylistManifest:
+    """记录每个歌单文件的内容哈希、修改时间以及它贡献的歌曲
+
+    未变化的歌单文件（mtime 和大小一致，或内容哈希一致）不会重新读取和解析，
+    直接复用上次记录的歌曲列表。同时记录上次写出的 musics.json 状态，
+    以及歌单中尚未成功获取的歌曲；歌单和输出文件都没有变化、
+    并且没有待获取的歌曲时才可以直接跳过整次运行。
+    上游确认不可用的歌曲（例如已下架）不算待获取，等待期过后才重新尝试。
+
+    Args:
+        path: 清单文件路径
+        salt: 影响解析结果的其他输入（例如 PREDATA）的摘要，变化时丢弃所有记录
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH, salt: str = ""):
+        self.path = path
+        self.salt = salt
+        self.files: dict[str, dict] = {}
+        self.catalog: dict = {}
+        # 歌单中引用、但上次运行后仍不在目录中的 (来源, ID)
+        self.pending: list[list[str]] = []
+        # 上游确认不可用的 (来源, ID) 到下次重试时间的映射
+        self.unavailable: dict[tuple[str, str], float] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = json_codec.loads(f.read())
+                if data.get("salt", "") == salt:
+                    self.files = data.get("files", {})
+                    self.catalog = data.get("catalog", {})
+                    self.pending = data.get("pending", [])
+                    self.unavailable = {
+                        (source, song_id): retry_at
+                        for source, song_id, retry_at in data.get("unavailable", [])
+                    }
+            except (ValueError, OSError) as e:
+                print(f"歌单清单解析失败，将重新扫描所有歌单: {e}")
+
+    def is_unchanged(self, filename: str, path: str) -> bool:
+        """仅通过 stat 判断文件是否未变化"""
+        entry = self.files.get(filename)
+        return entry is not None and entry.get("stat") == _stat_key(path)
+
+    def tracks(self, filename: str) -> list[dict]:
+        return self.files.get(filename, {}).get("tracks", [])
+
+    async def read(self, filename: str, path: str) -> tuple[bytes, bool]:
+        """读取歌单文件，返回内容以及内容哈希是否与上次一致"""
+        async with aiofiles.open(path, "rb") as f:
+            content = await f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        entry = self.files.get(filename)
+        unchanged = entry is not None and entry.get("sha256") == digest
+        if unchanged:
+            # 内容没变但 mtime 变了（例如重新检出），只更新 stat
+            entry["stat"] = _stat_key(path)
+        else:
+            self.files[filename] = {
+                "stat": _stat_key(path),
+                "sha256": digest,
+                "tracks": [],
+            }
+        return content, unchanged
+
+    def set_tracks(self, filename: str, tracks: list[dict]) -> None:
+        self.files[filename]["tracks"] = tracks
+
+    def entry(self, filename: str) -> dict | None:
+        return self.files.get(filename)
+
+    def restore(self, filename: str, entry: dict | None) -> None:
+        """歌单文件解析失败时恢复上次成功解析的记录
+
+        去掉 stat，下次运行会重新读取文件：内容改回原样时直接复用记录，
+        仍然无法解析时继续沿用上次的歌曲。
+        """
+        if entry is None:
+            self.files.pop(filename, None)
+        else:
+            self.files[filename] = {**entry, "stat": None}
+
+    def retain(self, filenames: set[str]) -> list[str]:
+        """移除已删除的歌单文件，返回被移除的文件名"""
+        removed = [name for name in self.files if name not in filenames]
+        for name in removed:
+            del self.files[name]
+        return removed
+
+    def catalog_unchanged(self, path: str) -> bool:
+        return os.path.exists(path) and self.catalog == _stat_key(path)
+
+    def set_pending(self, keys: set[tuple[str, str]]) -> None:
+        """记录本次运行后仍未获取到的歌曲，下次运行会重试它们"""
+        self.pending = sorted([source, song_id] for source, song_id in keys)
+
+    def retry_due(self, now: float) -> bool:
+        """是否有不可用歌曲的等待期已经结束，需要重新尝试"""
+        return any(retry_at <= now for retry_at in self.unavailable.values())
+
+    def set_unavailable(self, unavailable: dict[tuple[str, str], float]) -> None:
+        """记录上游确认不可用的歌曲及其下次重试时间，这些歌曲不计入 pending"""
+        self.unavailable = unavailable
+
+    def mark_catalog(self, path: str) -> None:
+        self.catalog = _stat_key(path) if os.path.exists(path) else {}
+
+    async def save(self) -> None:
+        await write_json_atomic(
+            self.path,
+            {
+                "salt": self.salt,
+                "files": self.files,
+                "catalog": self.catalog,
+                "pending": self.pending,
+                "unavailable": [
+                    [source, song_id, retry_at]
+                    for (source, song_id), retry_at in sorted(self.unavailable.items())
+                ],
+            },
+        )
@@ -0,0 +1,185 @@
+import os
+import time
+from typing import Literal
+
+import httpx
+
+from playlist_http import LatencyTracker, is_throttled
+from playlist_http_cache import from_cache
+
+# 网易云接口镜像，路径与官方接口一致，可以用环境变量 NCM_MIRRORS（逗号分隔）覆盖
+DEFAULT_NCM_MIRRORS = [
+    "https://ncm.api.liteyuki.org",
+    "https://music.163.com",
+]
+# EWMA 平滑系数，越大越偏向最近的请求
+EWMA_ALPHA = 0.2
+# 连续失败这么多次后熔断
+FAILURE_THRESHOLD = 3
+# 错误率（EWMA）超过该值且样本足够时熔断
+ERROR_RATE_THRESHOLD = 0.5
+MIN_SAMPLES = 10
+# 熔断后多久允许一次半开探测（秒），探测失败时翻倍，直到上限
+OPEN_COOLDOWN = 30.0
+MAX_COOLDOWN = 600.0
+
+
+def ncm_mirrors() -> list[str]:
+    """当前配置的网易云镜像列表，按优先级排列"""
+    configured = [u.strip().rstrip("/") for u in os.getenv("NCM_MIRRORS", "").split(",")]
+    return [u for u in configured if u] or list(DEFAULT_NCM_MIRRORS)
+
+
+class MirrorHealth:
+    """单个镜像的健康状态：EWMA 延迟、EWMA 错误率和熔断器
+
+    熔断器状态:
+        closed     正常接收请求
+        open       熔断中，冷却时间内不接收请求
+        half_open  冷却结束，只放行一个探测请求，成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+        self.state: Literal["closed", "open", "half_open"] = "closed"
+        self.opened_at = 0.0
+        self.cooldown = OPEN_COOLDOWN
+        self.probing = False
+        # 保留最近的延迟样本，供对冲请求计算 p95 阈值
+        self.tracker = LatencyTracker()
+
+    @property
+    def host(self) -> str:
+        return httpx.URL(self.base_url).host
+
+    def available(self, now: float | None = None) -> bool:
+        """是否可以向该镜像发出请求，冷却结束的熔断镜像会进入半开状态"""
+        if self.state == "open":
+            if (now or time.monotonic()) - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            return not self.probing
+        return True
+
+    def score(self) -> float:
+        """期望的成功请求耗时，越小越优先；还没有样本的镜像排在最前面以便尽早测出延迟"""
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(0.05, 1.0 - self.error_rate)
+
+    def acquire(self) -> None:
+        if self.state == "half_open":
+            self.probing = True
+
+    def release(self) -> None:
+        self.probing = False
+
+    def record_success(self, seconds: float) -> None:
+        self.tracker.record(seconds)
+        self.latency = (
+            seconds
+            if self.latency is None
+            else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+        )
+        self.error_rate *= 1 - EWMA_ALPHA
+        self.samples += 1
+        self.failures = 0
+        if self.state != "closed":
+            print(f"镜像已恢复: {self.base_url}")
+            self.state = "closed"
+            self.cooldown = OPEN_COOLDOWN
+
+    def record_failure(self) -> None:
+        self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+        self.samples += 1
+        self.failures += 1
+        if self.state == "half_open":
+            # 半开探测失败，延长冷却时间后重新熔断
+            self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            self.open()
+        elif self.state == "closed" and (
+            self.failures >= FAILURE_THRESHOLD
+            or (self.samples >= MIN_SAMPLES and self.error_rate > ERROR_RATE_THRESHOLD)
+        ):
+            self.open()
+
+    def open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        print(f"镜像已熔断 {self.cooldown:.0f} 秒: {self.base_url}")
+
+
+class MirrorPool:
+    """一组提供相同接口的镜像，请求发往当前最快的健康镜像，失败时自动切换
+
+    Args:
+        base_urls: 镜像地址，没有延迟数据时按列表顺序优先
+    """
+
+    def __init__(self, base_urls: list[str]):
+        self.mirrors = [MirrorHealth(url.rstrip("/")) for url in base_urls]
+
+    @property
+    def host(self) -> str:
+        """下一个请求将要发往的镜像主机，用于记录重试"""
+        return (self.ranked() or self.mirrors)[0].host
+
+    def ranked(self) -> list[MirrorHealth]:
+        """可用的镜像，半开状态的镜像排在最前面用于探测，其余按 score 从小到大排列"""
+        now = time.monotonic()
+        available = [m for m in self.mirrors if m.available(now)]
+        order = {id(m): i for i, m in enumerate(self.mirrors)}
+        return sorted(
+            available,
+            key=lambda m: (m.state != "half_open", m.score(), order[id(m)]),
+        )
+
+    async def attempt(
+        self, client: httpx.AsyncClient, mirror: MirrorHealth, path: str, **kwargs
+    ) -> httpx.Response:
+        """向指定镜像发出一次 GET 请求并记录结果，网络错误和 429/5xx 会抛出 httpx.HTTPError"""
+        mirror.acquire()
+        started_at = time.monotonic()
+        try:
+            response = await client.get(mirror.base_url + path, **kwargs)
+        except httpx.HTTPError:
+            mirror.record_failure()
+            raise
+        finally:
+            mirror.release()
+        if is_throttled(response.status_code):
+            mirror.record_failure()
+            response.raise_for_status()
+        # 命中本地 HTTP 缓存的响应不代表镜像的延迟
+        if not from_cache(response):
+            mirror.record_success(time.monotonic() - started_at)
+        return response
+
+    async def get(self, client: httpx.AsyncClient, path: str, **kwargs) -> httpx.Response:
+        """按当前排名依次尝试各个镜像，全部失败时抛出最后一个错误
+
+        Args:
+            client: 共享的连接池客户端
+            path: 以 / 开头的接口路径，可以带查询参数
+            **kwargs: 传给 client.get 的其他参数
+        """
+        mirrors = self.ranked()
+        if not mirrors:
+            raise httpx.ConnectError(f"没有可用的镜像: {path}")
+        last_error: httpx.HTTPError | None = None
+        for mirror in mirrors:
+            try:
+                return await self.attempt(client, mirror, path, **kwargs)
+            except httpx.HTTPError as e:
+                print(f"镜像请求失败，切换到下一个镜像: {mirror.base_url}{path} - {e}")
+                last_error = e
+        raise last_error
+
+
+# 整个进程共用一个网易云镜像池，健康状态在一次运行中持续累积
+ncm_pool = MirrorPool(ncm_mirrors())
@@ -0,0 +1,218 @@
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+
+import httpx
+
+from playlist_http import map_unordered
+from playlist_sqlite import SqliteStore
+
+PROBE_CACHE_PATH = "./.cache/probes.sqlite3"
+# 可用的音频源一天内不再重复探测
+ALIVE_TTL = 24 * 3600
+# 失效的音频源可能很快被修复，缓存时间短一些
+DEAD_TTL = 3600
+PROBE_WORKERS = 16
+PROBE_TIMEOUT = 10.0
+# HEAD 不被支持或没有返回大小时，改用只请求 1 个字节的 Range GET
+HEAD_FALLBACK_STATUS = {403, 405, 501}
+# 明确表示文件不存在的状态码；429/5xx 等其他状态只说明上游暂时不可用，不能据此删除歌曲
+DEAD_STATUS = {404, 410}
+
+
+@dataclass
+class ProbeResult:
+    """一次音频源探测的结果
+
+    只有 alive 和 dead 是确定的结论。status 为 0（网络错误）、429/5xx 以及其他
+    状态码都无法判断音频源是否可用，这类结果不会被缓存，对应的歌曲也不会被移除。
+    """
+
+    status: int
+    size: int | None = None
+    content_type: str = ""
+    checked_at: float = 0.0
+    etag: str = ""
+    last_modified: str = ""
+
+    @property
+    def alive(self) -> bool:
+        if self.status not in (200, 206):
+            return False
+        # 部分 CDN 对不存在的对象返回 200 的 HTML 错误页
+        if self.content_type.startswith("text/"):
+            return False
+        return self.size is None or self.size > 0
+
+    @property
+    def dead(self) -> bool:
+        """确定已经失效：404/410，或者返回了 200 的文本错误页"""
+        if self.status in DEAD_STATUS:
+            return True
+        return self.status in (200, 206) and self.content_type.startswith("text/")
+
+    @property
+    def known(self) -> bool:
+        return self.alive or self.dead
+
+    @property
+    def validator(self) -> str:
+        """标识文件版本的字符串，文件内容变化时会随之变化"""
+        return self.etag or f"{self.last_modified}:{self.size}"
+
+
+def _parse_size(response: httpx.Response) -> int | None:
+    content_range = response.headers.get("content-range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("content-length", "")
+    if response.status_code == 200 and length.isdigit():
+        return int(length)
+    return None
+
+
+async def probe_source(client: httpx.AsyncClient, url: str) -> ProbeResult:
+    """探测音频源是否可用，先发 HEAD，必要时退回到 Range: bytes=0-0
+
+    Args:
+        client: 共享的连接池客户端
+        url: 音频地址
+    """
+    try:
+        response = await client.head(url, follow_redirects=True, timeout=PROBE_TIMEOUT)
+        if response.status_code in HEAD_FALLBACK_STATUS or (
+            response.status_code == 200 and _parse_size(response) is None
+        ):
+            # 只读取响应头，服务器忽略 Range 返回完整文件时也不会下载正文
+            async with client.stream(
+                "GET",
+                url,
+                headers={"Range": "bytes=0-0"},
+                follow_redirects=True,
+                timeout=PROBE_TIMEOUT,
+            ) as response:
+                pass
+    except httpx.HTTPError:
+        return ProbeResult(status=0, checked_at=time.time())
+    return ProbeResult(
+        status=response.status_code,
+        size=_parse_size(response),
+        content_type=response.headers.get("content-type", "").split(";")[0].strip(),
+        checked_at=time.time(),
+        etag=response.headers.get("etag", ""),
+        last_modified=response.headers.get("last-modified", ""),
+    )
+
+
+class ProbeCache(SqliteStore):
+    """基于 SQLite 的音频源探测结果缓存，以 URL 为键，可用和失效的结果分别计时"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS probes (
+            url TEXT PRIMARY KEY,
+            status INTEGER NOT NULL,
+            size INTEGER,
+            content_type TEXT NOT NULL,
+            checked_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            etag TEXT NOT NULL DEFAULT '',
+            last_modified TEXT NOT NULL DEFAULT ''
+        );
+    """
+
+    def __init__(
+        self,
+        path: str = PROBE_CACHE_PATH,
+        alive_ttl: float = ALIVE_TTL,
+        dead_ttl: float = DEAD_TTL,
+    ):
+        super().__init__(path)
+        self.alive_ttl = alive_ttl
+        self.dead_ttl = dead_ttl
+        self.hits = 0
+        self.misses = 0
+        # 旧版本创建的表没有验证器字段
+        self.add_missing_columns(
+            "probes",
+            {
+                "etag": "TEXT NOT NULL DEFAULT ''",
+                "last_modified": "TEXT NOT NULL DEFAULT ''",
+            },
+        )
+
+    def get(self, url: str) -> ProbeResult | None:
+        """读取未过期的探测结果"""
+        row = self.conn.execute(
+            "SELECT status, size, content_type, checked_at, etag, last_modified "
+            "FROM probes WHERE url = ? AND expires_at > ?",
+            (url, time.time()),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ProbeResult(*row)
+
+    def set(self, url: str, result: ProbeResult) -> None:
+        """写入探测结果，网络错误的结果不会被缓存"""
+        if not result.known:
+            return
+        ttl = self.alive_ttl if result.alive else self.dead_ttl
+        self.write(
+            "INSERT OR REPLACE INTO probes "
+            "(url, status, size, content_type, checked_at, expires_at, etag, last_modified) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                url,
+                result.status,
+                result.size,
+                result.content_type,
+                result.checked_at,
+                result.checked_at + ttl,
+                result.etag,
+                result.last_modified,
+            ),
+        )
+
+    def prune(self) -> int:
+        """清理过期的探测结果，返回删除数量"""
+        return self.write("DELETE FROM probes WHERE expires_at <= ?", (time.time(),))
+
+
+async def verify_sources(
+    client: httpx.AsyncClient,
+    urls: list[str],
+    cache: ProbeCache,
+    workers: int = PROBE_WORKERS,
+) -> dict[str, ProbeResult]:
+    """并发探测一组音频源，未过期的缓存结果直接复用
+
+    Args:
+        client: 共享的连接池客户端
+        urls: 音频地址，重复的地址只探测一次
+        cache: 探测结果缓存
+        workers: 最大并发数
+
+    Returns:
+        每个地址的探测结果
+    """
+    results: dict[str, ProbeResult] = {}
+    pending: list[str] = []
+    for url in dict.fromkeys(urls):
+        cached = cache.get(url)
+        if cached is None:
+            pending.append(url)
+        else:
+            results[url] = cached
+
+    async with aclosing(
+        map_unordered(pending, lambda url: probe_source(client, url), workers)
+    ) as probes:
+        async for url, result in probes:
+            if isinstance(result, BaseException):
+                result = ProbeResult(status=0, checked_at=time.time())
+            cache.set(url, result)
+            results[url] = result
+    return results
@@ -0,0 +1,163 @@
+from abc import ABC, abstractmethod
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING
+
+import httpx
+
+from playlist_http import HOST_LIMITS, HostLimit, map_unordered
+
+if TYPE_CHECKING:
+    from playlist_dump import Song, SongInfo
+    from playlist_lyric_cache import LyricCache
+
+
+@dataclass(frozen=True)
+class SourceCapabilities:
+    """来源接口的能力声明，调度器据此为每个来源决定批大小和并发
+
+    Attributes:
+        max_batch: 单次元数据批量请求的最大歌曲数
+        max_in_flight: 同时处理的批次数
+        host_limits: 该来源用到的上游主机的限流配置，会合并进整次运行共用的 RateLimiter
+        urls_expire: 音频地址是否带签名、会过期
+        url_ttl: 音频地址的有效期（秒），不会过期时为 None
+    """
+
+    max_batch: int = 10
+    max_in_flight: int = 4
+    host_limits: dict[str, HostLimit] = field(default_factory=dict)
+    urls_expire: bool = False
+    url_ttl: float | None = None
+
+
+class SourceAdapter(ABC):
+    """音乐来源适配器的基类
+
+    每个来源实现元数据批量获取、歌词获取和音频地址解析，并通过 capabilities
+    声明自身的限制。新增来源只需实现一个子类并调用 register_source()，
+    不需要修改 playlist_dump 的调度逻辑。
+    """
+
+    name: str = ""
+    capabilities: SourceCapabilities = SourceCapabilities()
+
+    @abstractmethod
+    async def fetch_songs(
+        self,
+        client: httpx.AsyncClient,
+        songs_info: list["SongInfo"],
+        lyric_cache: "LyricCache | None" = None,
+    ) -> list["Song"]:
+        """获取一批歌曲的元数据、音频地址和歌词，批大小不超过 capabilities.max_batch"""
+
+    @abstractmethod
+    async def fetch_lyric(self, client: httpx.AsyncClient, mid: str) -> str:
+        """获取单首歌曲的歌词（不经过本地缓存），失败时返回空字符串"""
+
+    @abstractmethod
+    async def resolve_urls(
+        self, client: httpx.AsyncClient, ids: list[str]
+    ) -> dict[str, str]:
+        """重新解析一批歌曲的音频地址，返回歌曲ID到地址的映射，解析失败的歌曲不在结果中"""
+
+    async def attach_lyrics(
+        self,
+        client: httpx.AsyncClient,
+        songs: list["Song"],
+        lrcmid_map: dict[str, str],
+        workers: int,
+        lyric_cache: "LyricCache | None" = None,
+    ) -> None:
+        """用 fetch_lyric 有限并发地获取一批歌曲的歌词并写回 song.lrc
+
+        Args:
+            client: 复用的连接池客户端
+            songs: 需要歌词的歌曲
+            lrcmid_map: 歌曲ID到歌词来源ID的映射，没有时使用歌曲本身的ID
+            workers: 最大并发数
+            lyric_cache: 本地歌词缓存，以 (来源, 歌词ID) 为键
+        """
+
+        async def fetch(song: "Song") -> str:
+            lyric_mid = lrcmid_map.get(song.id, song.id)
+            fetch_lyric = partial(self.fetch_lyric, client, lyric_mid)
+            if lyric_cache is not None:
+                return await lyric_cache.get_or_fetch(self.name, lyric_mid, fetch_lyric)
+            return await fetch_lyric()
+
+        # 按完成顺序写回，退出时取消未完成的请求
+        async with aclosing(map_unordered(songs, fetch, workers)) as lyrics:
+            async for song, lrc in lyrics:
+                if isinstance(lrc, BaseException):
+                    print(f"获取 {self.name} 歌词出错: {song.id} - {lrc}")
+                    continue
+                song.lrc = lrc
+                if lrc == "":
+                    print(f"未获取到歌词: {song.title} - {song.artist} (ID: {song.id})")
+
+
+# 已注册的来源，键为歌单文件中的 type
+SOURCE_ADAPTERS: dict[str, SourceAdapter] = {}
+
+
+def register_source(adapter: SourceAdapter) -> SourceAdapter:
+    SOURCE_ADAPTERS[adapter.name] = adapter
+    return adapter
+
+
+def get_source(name: str) -> SourceAdapter | None:
+    return SOURCE_ADAPTERS.get(name)
+
+
+def source_capabilities(name: str) -> SourceCapabilities:
+    """来源的能力声明，未注册的来源使用默认值"""
+    adapter = SOURCE_ADAPTERS.get(name)
+    return adapter.capabilities if adapter is not None else SourceCapabilities()
+
+
+def host_limits() -> dict[str, HostLimit]:
+    """HOST_LIMITS 与所有已注册来源声明的主机限流配置合并后的结果"""
+    limits = dict(HOST_LIMITS)
+    for adapter in SOURCE_ADAPTERS.values():
+        limits.update(adapter.capabilities.host_limits)
+    return limits
+
+
+def url_ttls() -> dict[str, float]:
+    """音频地址会过期的已注册来源及其有效期（秒）"""
+    return {
+        name: adapter.capabilities.url_ttl
+        for name, adapter in SOURCE_ADAPTERS.items()
+        if adapter.capabilities.urls_expire and adapter.capabilities.url_ttl is not None
+    }
+
+
+def plan_refresh(
+    candidates: list[tuple[str, str, float]], budget: int
+) -> dict[str, list[str]]:
+    """按优先级挑选需要重新解析音频地址的歌曲，请求数不超过预算
+
+    每个来源按 max_batch 合并成批量请求，已经占用预算的批次未满时，
+    后面的同来源歌曲可以继续加入，不额外消耗预算。
+
+    Args:
+        candidates: (来源, ID, 过期时间) 列表，按优先级排列
+        budget: 本次运行最多发出的解析请求数
+
+    Returns:
+        来源到待刷新歌曲ID的映射
+    """
+    selected: dict[str, list[str]] = {}
+    used = 0
+    for source, song_id, _ in candidates:
+        if source not in SOURCE_ADAPTERS:
+            continue
+        ids = selected.setdefault(source, [])
+        if len(ids) % source_capabilities(source).max_batch == 0:
+            if used >= budget:
+                continue
+            used += 1
+        ids.append(song_id)
+    return {source: ids for source, ids in selected.items() if ids}
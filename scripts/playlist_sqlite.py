@@ -0,0 +1,58 @@
+import os
+import sqlite3
+from typing import Any, Self, Sequence
+
+
+class SqliteStore:
+    """playlist_* 脚本共用的 SQLite 存储基类
+
+    负责创建所在目录、打开连接、启用 WAL 并建表，支持 with 语句。
+    子类在 SCHEMA 中声明表结构，需要在关闭时清理条目的子类重写 prune()。
+
+    Args:
+        path: 数据库路径，":memory:" 时使用内存数据库
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            "PRAGMA journal_mode=WAL;\nPRAGMA synchronous=NORMAL;\n" + self.SCHEMA
+        )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add_missing_columns(self, table: str, columns: dict[str, str]) -> None:
+        """给旧版本创建的表补上缺少的字段
+
+        Args:
+            table: 表名
+            columns: 字段名到字段定义（类型和默认值）的映射
+        """
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        for name, definition in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def write(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """执行一条写语句并立即提交，返回受影响的行数"""
+        count = self.conn.execute(sql, params).rowcount
+        self.conn.commit()
+        return count
+
+    def prune(self) -> int:
+        """关闭前清理条目，返回删除数量，默认不清理"""
+        return 0
+
+    def close(self) -> None:
+        """清理后关闭连接，未提交的修改会被丢弃"""
+        self.prune()
+        self.conn.close()
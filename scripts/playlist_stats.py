@@ -0,0 +1,175 @@
+import bisect
+import time
+from collections import Counter
+
+import httpx
+
+from playlist_io import write_json_atomic
+
+# 延迟直方图的桶上界（秒），最后一个桶收集所有更慢的请求
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class HostStats:
+    """单个上游主机的请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.status_codes: Counter[int] = Counter()
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latencies: list[float] = []
+
+    def record_latency(self, seconds: float) -> None:
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "status_codes": {
+                str(code): count for code, count in sorted(self.status_codes.items())
+            },
+            "latency": {
+                "p50": round(self.percentile(0.5), 4),
+                "p95": round(self.percentile(0.95), 4),
+                "p99": round(self.percentile(0.99), 4),
+                "max": round(max(self.latencies, default=0.0), 4),
+                "buckets": [
+                    {"le": le, "count": count}
+                    for le, count in zip(LATENCY_BUCKETS + ["+Inf"], self.histogram)
+                ],
+            },
+        }
+
+
+class RunStats:
+    """一次运行中所有上游请求、缓存和计数器的统计
+
+    Args:
+        name: 运行名称，写入报告中用于区分脚本
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.started_at = time.time()
+        self.hosts: dict[str, HostStats] = {}
+        self.caches: dict[str, dict[str, int]] = {}
+        self.counters: Counter[str] = Counter()
+
+    def host(self, host: str) -> HostStats:
+        if host not in self.hosts:
+            self.hosts[host] = HostStats()
+        return self.hosts[host]
+
+    def record_retry(self, host: str) -> None:
+        self.host(host).retries += 1
+
+    def record_cache(self, name: str, hits: int, misses: int) -> None:
+        self.caches[name] = {"hits": hits, "misses": misses}
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "elapsed": round(time.time() - self.started_at, 3),
+            "hosts": {host: stats.to_dict() for host, stats in self.hosts.items()},
+            "caches": {
+                name: {
+                    **cache,
+                    "hit_rate": round(
+                        cache["hits"] / max(1, cache["hits"] + cache["misses"]), 4
+                    ),
+                }
+                for name, cache in self.caches.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def summary(self) -> str:
+        """生成简短的文本汇总表"""
+        lines = [
+            f"{'host':<28}{'req':>7}{'err':>6}{'retry':>7}{'p50':>8}{'p95':>8}{'bytes':>12}  status"
+        ]
+        for host, stats in sorted(self.hosts.items()):
+            codes = " ".join(
+                f"{code}x{count}" for code, count in sorted(stats.status_codes.items())
+            )
+            lines.append(
+                f"{host:<28}{stats.requests:>7}{stats.errors:>6}{stats.retries:>7}"
+                f"{stats.percentile(0.5):>8.3f}{stats.percentile(0.95):>8.3f}{stats.bytes:>12}  {codes}"
+            )
+        for name, cache in self.caches.items():
+            total = cache["hits"] + cache["misses"]
+            rate = cache["hits"] / total if total else 0.0
+            lines.append(f"cache {name}: {cache['hits']}/{total} 命中 ({rate:.1%})")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    async def write_report(self, path: str) -> None:
+        await write_json_atomic(path, self.to_dict(), indent=2)
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, stats: HostStats):
+        self.stream = stream
+        self.stats = stats
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.stats.bytes += len(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """记录每个请求的主机、状态码、延迟（到收到响应头为止）和响应字节数"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: RunStats):
+        self.transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host_stats = self.stats.host(request.url.host)
+        host_stats.requests += 1
+        started_at = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            host_stats.errors += 1
+            host_stats.record_latency(time.monotonic() - started_at)
+            raise
+        host_stats.record_latency(time.monotonic() - started_at)
+        host_stats.status_codes[response.status_code] += 1
+        if response.status_code >= 400:
+            host_stats.errors += 1
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_CountingStream(response.stream, host_stats),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# 当前运行的统计，脚本入口负责设置名称并在结束时写出报告
+run_stats = RunStats()
@@ -0,0 +1,310 @@
+import time
+from typing import Iterable, Iterator
+
+import json_codec
+from playlist_sqlite import SqliteStore
+
+CATALOG_DB_PATH = "./.cache/catalog.sqlite3"
+# 单独存放、导出时再填回歌曲对象的字段
+SPLIT_FIELDS = ("src", "lrc", "timeline")
+
+
+class CatalogStore(SqliteStore):
+    """基于 SQLite 的歌曲目录，playlist_dump 的工作存储
+
+    表结构:
+        songs            歌曲元数据（JSON），rank 决定导出顺序
+        sources          音频源地址、解析时间和过期时间（不会过期的为 NULL）
+        lyrics           歌词和预解析的时间轴
+        playlist_tracks  歌单文件与歌曲的引用关系
+
+    歌曲以 (来源, ID) 为键。一次运行中的所有修改都在同一个事务里，
+    只有 commit() 之后才会生效，中途崩溃时数据库保持上一次成功导出时的状态。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS songs (
+            source TEXT NOT NULL,
+            id TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (source, id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_songs_rank ON songs (rank);
+        CREATE TABLE IF NOT EXISTS sources (
+            source TEXT NOT NULL,
+            id TEXT NOT NULL,
+            src TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (source, id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sources_src ON sources (src);
+        CREATE TABLE IF NOT EXISTS lyrics (
+            source TEXT NOT NULL,
+            id TEXT NOT NULL,
+            lrc TEXT NOT NULL,
+            timeline TEXT,
+            PRIMARY KEY (source, id)
+        );
+        CREATE TABLE IF NOT EXISTS playlist_tracks (
+            playlist TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            id TEXT NOT NULL,
+            PRIMARY KEY (playlist, position)
+        );
+        CREATE INDEX IF NOT EXISTS idx_playlist_tracks_song ON playlist_tracks (source, id);
+    """
+
+    def __init__(
+        self, path: str = CATALOG_DB_PATH, url_ttls: dict[str, float] | None = None
+    ):
+        """
+        Args:
+            path: 数据库路径
+            url_ttls: 音频地址会过期的来源及其有效期（秒），见 playlist_sources.url_ttls()
+        """
+        super().__init__(path)
+        self.url_ttls = url_ttls or {}
+        # 旧版本创建的表没有过期时间
+        self.add_missing_columns("sources", {"expires_at": "REAL"})
+        # 有效期配置变化后，按解析时间重新计算过期时间
+        for source, ttl in self.url_ttls.items():
+            self.conn.execute(
+                "UPDATE sources SET expires_at = updated_at + ? WHERE source = ?",
+                (ttl, source),
+            )
+        self.conn.execute(
+            f"UPDATE sources SET expires_at = NULL WHERE source NOT IN ({','.join('?' * len(self.url_ttls))})",
+            list(self.url_ttls),
+        )
+        self.conn.commit()
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    def keys(self) -> set[tuple[str, str]]:
+        """所有歌曲的 (来源, ID)"""
+        return set(self.conn.execute("SELECT source, id FROM songs"))
+
+    def clear(self) -> None:
+        for table in ("songs", "sources", "lyrics"):
+            self.conn.execute(f"DELETE FROM {table}")
+
+    def _expires_at(self, source: str, resolved_at: float) -> float | None:
+        ttl = self.url_ttls.get(source)
+        return None if ttl is None else resolved_at + ttl
+
+    def _put(self, songs: Iterable[dict], first_rank: int, resolved_at: float) -> int:
+        song_rows, source_rows, lyric_rows = [], [], []
+        for rank, song in enumerate(songs, first_rank):
+            key = (str(song.get("source", "")), str(song.get("id", "")))
+            # 拆出的字段在元数据中保留为占位，导出时按原来的字段顺序填回
+            data = {k: (None if k in SPLIT_FIELDS else v) for k, v in song.items()}
+            song_rows.append((*key, rank, json_codec.dumps(data)))
+            source_rows.append(
+                (*key, song.get("src") or "", resolved_at, self._expires_at(key[0], resolved_at))
+            )
+            timeline = song.get("timeline")
+            lyric_rows.append(
+                (
+                    *key,
+                    song.get("lrc") or "",
+                    None if timeline is None else json_codec.dumps(timeline),
+                )
+            )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO songs (source, id, rank, data) VALUES (?, ?, ?, ?)",
+            song_rows,
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO sources (source, id, src, updated_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            source_rows,
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO lyrics (source, id, lrc, timeline) VALUES (?, ?, ?, ?)",
+            lyric_rows,
+        )
+        return len(song_rows)
+
+    def load(self, songs: Iterable[dict]) -> int:
+        """清空目录并按给定顺序导入歌曲（用于从 musics.json 初始化或重新同步）
+
+        导入的音频地址解析时间未知，记为 0，会过期的地址在刷新模式中最先被重新解析。
+
+        Returns:
+            导入的歌曲数量
+        """
+        self.clear()
+        return self._put(songs, 0, 0.0)
+
+    def upsert(self, songs: list[dict]) -> int:
+        """插入或替换歌曲，本次写入的歌曲按给定顺序排在最前面
+
+        Returns:
+            写入的歌曲数量
+        """
+        top = self.conn.execute("SELECT COALESCE(MIN(rank), 0) FROM songs").fetchone()[0]
+        return self._put(songs, top - len(songs), time.time())
+
+    def set_playlists(self, playlists: dict[str, list[tuple[str, str]]]) -> None:
+        """用本次扫描的结果替换歌单引用关系
+
+        Args:
+            playlists: 歌单文件名到 (来源, ID) 列表的映射
+        """
+        self.conn.execute("DELETE FROM playlist_tracks")
+        self.conn.executemany(
+            "INSERT INTO playlist_tracks (playlist, position, source, id) VALUES (?, ?, ?, ?)",
+            (
+                (filename, position, source, song_id)
+                for filename, keys in playlists.items()
+                for position, (source, song_id) in enumerate(keys)
+            ),
+        )
+
+    def prune_unreferenced(self) -> int:
+        """删除不再被任何歌单引用的歌曲，返回删除数量"""
+        removed = self.conn.execute(
+            """
+            DELETE FROM songs WHERE NOT EXISTS (
+                SELECT 1 FROM playlist_tracks t
+                WHERE t.source = songs.source AND t.id = songs.id
+            )
+            """
+        ).rowcount
+        for table in ("sources", "lyrics"):
+            self.conn.execute(
+                f"""
+                DELETE FROM {table} WHERE NOT EXISTS (
+                    SELECT 1 FROM songs s
+                    WHERE s.source = {table}.source AND s.id = {table}.id
+                )
+                """
+            )
+        return removed
+
+    def sources(self) -> list[str]:
+        """目录中所有非空的音频源地址"""
+        return [row[0] for row in self.conn.execute("SELECT src FROM sources WHERE src != ''")]
+
+    def remove_by_src(self, urls: Iterable[str]) -> list[tuple[str, str]]:
+        """删除使用这些音频源的歌曲，返回被删除歌曲的 (来源, ID)"""
+        keys = [
+            key
+            for url in urls
+            for key in self.conn.execute("SELECT source, id FROM sources WHERE src = ?", (url,))
+        ]
+        for table in ("songs", "sources", "lyrics"):
+            self.conn.executemany(f"DELETE FROM {table} WHERE source = ? AND id = ?", keys)
+        return keys
+
+    def update_by_src(self, fields_by_src: dict[str, dict]) -> int:
+        """更新使用指定音频源的歌曲的元数据字段，只写入实际变化的行
+
+        Args:
+            fields_by_src: 音频地址到要写入的字段的映射
+
+        Returns:
+            更新的歌曲数量
+        """
+        updates = []
+        for url, fields in fields_by_src.items():
+            rows = self.conn.execute(
+                "SELECT s.source, s.id, s.data FROM songs s JOIN sources USING (source, id) "
+                "WHERE sources.src = ?",
+                (url,),
+            )
+            for source, song_id, data in rows:
+                song = json_codec.loads(data)
+                if all(song.get(k) == v for k, v in fields.items()):
+                    continue
+                song.update(fields)
+                updates.append((json_codec.dumps(song), source, song_id))
+        self.conn.executemany("UPDATE songs SET data = ? WHERE source = ? AND id = ?", updates)
+        return len(updates)
+
+    def expiring_sources(self, before: float) -> list[tuple[str, str, float]]:
+        """在 before 之前过期的音频地址，按刷新优先级排列
+
+        已经过期得越久越优先，过期时间相同时排在目录前面（较新）的歌曲优先。
+
+        Returns:
+            (来源, ID, 过期时间) 列表
+        """
+        return list(
+            self.conn.execute(
+                """
+                SELECT src.source, src.id, src.expires_at
+                FROM sources src JOIN songs s USING (source, id)
+                WHERE src.expires_at IS NOT NULL AND src.expires_at < ?
+                ORDER BY src.expires_at, s.rank
+                """,
+                (before,),
+            )
+        )
+
+    def expired_srcs(self, now: float) -> set[str]:
+        """已经过期的音频地址，它们的探测结果不能说明文件是否失效"""
+        return {
+            row[0]
+            for row in self.conn.execute(
+                "SELECT src FROM sources WHERE expires_at IS NOT NULL AND expires_at < ? AND src != ''",
+                (now,),
+            )
+        }
+
+    def refresh_sources(self, source: str, urls: dict[str, str]) -> int:
+        """写入重新解析的音频地址并更新解析时间和过期时间
+
+        Args:
+            source: 来源
+            urls: 歌曲ID到新音频地址的映射，没有出现的歌曲保持原来的地址
+
+        Returns:
+            地址实际发生变化的歌曲数量
+        """
+        now = time.time()
+        changed = 0
+        for song_id, src in urls.items():
+            row = self.conn.execute(
+                "SELECT src FROM sources WHERE source = ? AND id = ?", (source, song_id)
+            ).fetchone()
+            if row is None:
+                continue
+            changed += row[0] != src
+            self.conn.execute(
+                "UPDATE sources SET src = ?, updated_at = ?, expires_at = ? "
+                "WHERE source = ? AND id = ?",
+                (src, now, self._expires_at(source, now), source, song_id),
+            )
+        return changed
+
+    def iter_songs(self) -> Iterator[dict]:
+        """按导出顺序逐条读取完整的歌曲对象，不会一次性加载整个目录"""
+        cursor = self.conn.execute(
+            """
+            SELECT s.data, src.src, l.lrc, l.timeline
+            FROM songs s
+            LEFT JOIN sources src USING (source, id)
+            LEFT JOIN lyrics l USING (source, id)
+            ORDER BY s.rank
+            """
+        )
+        for data, src, lrc, timeline in cursor:
+            song = json_codec.loads(data)
+            values = {
+                "src": src or "",
+                "lrc": lrc or "",
+                "timeline": None if timeline is None else json_codec.loads(timeline),
+            }
+            for k, v in values.items():
+                if k in song:
+                    song[k] = v
+            yield song
+
+    def commit(self) -> None:
+        self.conn.commit()
+
@@ -1,5 +1,6 @@
 import type { NextRequest } from 'next/server'
 import { NextResponse } from 'next/server'
+import { fetchNcm } from '@/utils/ncm-mirrors'
 
 const lyricCache = new Map<string, string>()
 
@@ -16,7 +17,8 @@ export async function GET(request: NextRequest) {
   }
 
   // 这个接口响应的Content-Type为text/html，但实际上是JSON格式
-  const lyricsJsonText = await fetch(`https://music.163.com/api/song/media?id=${songId}`)
+  // 请求发往当前最快的健康镜像，失败时自动切换
+  const lyricsJsonText = await fetchNcm(`/api/song/media?id=${encodeURIComponent(songId)}`)
     .then((res) => {
       if (!res.ok) {
         throw new Error('Failed to fetch lyrics')
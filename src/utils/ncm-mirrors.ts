@@ -0,0 +1,137 @@
+// 网易云接口镜像池（服务端使用），与 scripts/playlist_mirrors.py 的策略一致：
+// - 每个镜像记录 EWMA 延迟和 EWMA 错误率，请求优先发往期望耗时最小的健康镜像
+// - 连续失败或错误率过高时熔断，冷却结束后半开，只放行一个探测请求
+// 镜像列表可以用环境变量 NCM_MIRRORS（逗号分隔）覆盖
+
+const DEFAULT_NCM_MIRRORS = ['https://ncm.api.liteyuki.org', 'https://music.163.com']
+const EWMA_ALPHA = 0.2
+const FAILURE_THRESHOLD = 3
+const ERROR_RATE_THRESHOLD = 0.5
+const MIN_SAMPLES = 10
+const OPEN_COOLDOWN = 30_000
+const MAX_COOLDOWN = 600_000
+const REQUEST_TIMEOUT = 5_000
+
+type CircuitState = 'closed' | 'open' | 'half_open'
+
+interface MirrorHealth {
+  baseUrl: string
+  latency: number | null
+  errorRate: number
+  samples: number
+  failures: number
+  state: CircuitState
+  openedAt: number
+  cooldown: number
+  probing: boolean
+}
+
+function createMirror(baseUrl: string): MirrorHealth {
+  return {
+    baseUrl: baseUrl.replace(/\/+$/, ''),
+    latency: null,
+    errorRate: 0,
+    samples: 0,
+    failures: 0,
+    state: 'closed',
+    openedAt: 0,
+    cooldown: OPEN_COOLDOWN,
+    probing: false,
+  }
+}
+
+const mirrors: MirrorHealth[] = (process.env.NCM_MIRRORS ?? '')
+  .split(',')
+  .map(url => url.trim())
+  .filter(Boolean)
+  .map(createMirror)
+if (mirrors.length === 0)
+  mirrors.push(...DEFAULT_NCM_MIRRORS.map(createMirror))
+
+function isAvailable(mirror: MirrorHealth, now: number): boolean {
+  if (mirror.state === 'open') {
+    if (now - mirror.openedAt < mirror.cooldown)
+      return false
+    mirror.state = 'half_open'
+  }
+  return mirror.state === 'half_open' ? !mirror.probing : true
+}
+
+// 期望的成功请求耗时，还没有样本的镜像排在最前面以便尽早测出延迟
+function score(mirror: MirrorHealth): number {
+  if (mirror.latency === null)
+    return 0
+  return mirror.latency / Math.max(0.05, 1 - mirror.errorRate)
+}
+
+function rankedMirrors(): MirrorHealth[] {
+  const now = Date.now()
+  return mirrors
+    .map((mirror, index) => ({ mirror, index }))
+    .filter(({ mirror }) => isAvailable(mirror, now))
+    .sort((a, b) =>
+      Number(a.mirror.state !== 'half_open') - Number(b.mirror.state !== 'half_open')
+      || score(a.mirror) - score(b.mirror)
+      || a.index - b.index,
+    )
+    .map(({ mirror }) => mirror)
+}
+
+function recordSuccess(mirror: MirrorHealth, latency: number) {
+  mirror.latency = mirror.latency === null ? latency : EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * mirror.latency
+  mirror.errorRate *= 1 - EWMA_ALPHA
+  mirror.samples += 1
+  mirror.failures = 0
+  mirror.state = 'closed'
+  mirror.cooldown = OPEN_COOLDOWN
+}
+
+function recordFailure(mirror: MirrorHealth) {
+  mirror.errorRate = EWMA_ALPHA + (1 - EWMA_ALPHA) * mirror.errorRate
+  mirror.samples += 1
+  mirror.failures += 1
+  if (mirror.state === 'half_open') {
+    mirror.cooldown = Math.min(mirror.cooldown * 2, MAX_COOLDOWN)
+    mirror.state = 'open'
+    mirror.openedAt = Date.now()
+  }
+  else if (
+    mirror.failures >= FAILURE_THRESHOLD
+    || (mirror.samples >= MIN_SAMPLES && mirror.errorRate > ERROR_RATE_THRESHOLD)
+  ) {
+    mirror.state = 'open'
+    mirror.openedAt = Date.now()
+  }
+}
+
+/**
+ * 按当前排名依次请求各个镜像，网络错误、超时和 429/5xx 时切换到下一个镜像
+ * @param path 以 / 开头的接口路径，可以带查询参数
+ * @returns 第一个非 429/5xx 的响应
+ */
+export async function fetchNcm(path: string): Promise<Response> {
+  let lastError: unknown = new Error('No NCM mirror available')
+  for (const mirror of rankedMirrors()) {
+    if (mirror.state === 'half_open')
+      mirror.probing = true
+    const startedAt = Date.now()
+    try {
+      const res = await fetch(`${mirror.baseUrl}${path}`, { signal: AbortSignal.timeout(REQUEST_TIMEOUT) })
+      if (res.status === 429 || res.status >= 500) {
+        recordFailure(mirror)
+        lastError = new Error(`${mirror.baseUrl} responded ${res.status}`)
+        continue
+      }
+      recordSuccess(mirror, Date.now() - startedAt)
+      return res
+    }
+    catch (error) {
+      recordFailure(mirror)
+      lastError = error
+    }
+    finally {
+      mirror.probing = false
+    }
+  }
+  throw lastError
+}